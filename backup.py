@@ -0,0 +1,96 @@
+import os
+import asyncio
+import sqlite3
+from datetime import datetime
+
+
+BACKUP_PREFIX = "bot_"
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+# одновременно идёт не больше одного бэкапа
+_backup_lock = asyncio.Lock()
+
+
+# ---------------- BLOCKING PART (worker thread) ----------------
+def _backup_blocking(db_path: str, dest_path: str, pages: int, sleep: float):
+    tmp_path = dest_path + ".part"
+    # время изменения базы на момент снимка — по нему needs_backup видит новые записи
+    source_mtime = last_modified(db_path)
+
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        # online backup API: копируем по pages страниц за шаг,
+        # между шагами писатели в исходную базу не блокируются
+        src.backup(dst, pages=pages, sleep=sleep)
+        (result,) = dst.execute("PRAGMA integrity_check").fetchone()
+        dst.close()
+        if result != "ok":
+            raise RuntimeError(f"Снимок не прошёл integrity_check: {result}")
+        os.replace(tmp_path, dest_path)
+    finally:
+        dst.close()
+        src.close()
+        # недописанный или битый снимок не оставляем
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    os.utime(dest_path, (source_mtime, source_mtime))
+
+
+def last_modified(db_path: str) -> float:
+    # запись в WAL-режиме меняет -wal, а не сам файл базы
+    return max(
+        (os.path.getmtime(p) for p in (db_path, db_path + "-wal") if os.path.exists(p)),
+        default=0.0,
+    )
+
+
+def list_backups(backup_dir: str) -> list[str]:
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted(
+        n for n in os.listdir(backup_dir)
+        if n.startswith(BACKUP_PREFIX) and n.endswith(".db")
+    )
+    return [os.path.join(backup_dir, n) for n in names]
+
+
+def _rotate(backup_dir: str, keep: int):
+    snapshots = list_backups(backup_dir)
+    for path in snapshots[:max(len(snapshots) - keep, 0)]:
+        os.remove(path)
+
+
+# ---------------- PUBLIC ----------------
+def needs_backup(db_path: str, backup_dir: str) -> bool:
+    """Была ли запись в базу после последнего снимка."""
+    if not os.path.exists(db_path):
+        return False
+    snapshots = list_backups(backup_dir)
+    if not snapshots:
+        return True
+    return last_modified(db_path) > os.path.getmtime(snapshots[-1])
+
+
+async def make_backup(
+    db_path: str,
+    backup_dir: str,
+    keep: int = 10,
+    pages: int = BACKUP_PAGES_PER_STEP,
+    sleep: float = BACKUP_STEP_SLEEP,
+) -> str:
+    """
+    Снимок базы через sqlite3 backup API в отдельном потоке,
+    чтобы event loop и хендлеры не ждали копирования.
+    Возвращает путь к проверенному снимку.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
+    dest_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{stamp}.db")
+
+    async with _backup_lock:
+        await asyncio.to_thread(_backup_blocking, db_path, dest_path, pages, sleep)
+        await asyncio.to_thread(_rotate, backup_dir, keep)
+
+    return dest_path
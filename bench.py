@@ -0,0 +1,218 @@
+"""
+Бенчмарки бота. Запуск:
+
+    python bench.py            # все
+    python bench.py backup     # только выбранные
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+import sqlite3
+import tempfile
+import statistics
+
+from db import init_db, get_user_label, upsert_user
+
+
+# ---------------- HELPERS ----------------
+def seed_users(db_path: str, n: int):
+    con = sqlite3.connect(db_path)
+    con.executemany(
+        "INSERT OR REPLACE INTO users(tg_id, username, full_name, is_active, created_at) "
+        "VALUES(?, ?, ?, 1, '2024-01-01T00:00:00')",
+        ((i, f"user{i}", f"Игрок {i}") for i in range(1, n + 1))
+    )
+    con.commit()
+    con.close()
+
+
+def report(title: str, samples: list[float]):
+    samples = sorted(samples)
+    # ближайший ранг: при малых n — не меньше медианы
+    p95 = samples[max(0, math.ceil(0.95 * len(samples)) - 1)]
+    print(
+        f"{title:<40} n={len(samples):<6} "
+        f"median={statistics.median(samples) * 1000:.2f}ms "
+        f"p95={p95 * 1000:.2f}ms max={samples[-1] * 1000:.2f}ms"
+    )
+
+
+async def handler_latency(db_path: str, n: int, users: int) -> list[float]:
+    # имитация типичного хендлера: чтение метки + запись пользователя
+    samples = []
+    for i in range(n):
+        tg_id = i % users + 1
+        t0 = time.perf_counter()
+        await get_user_label(db_path, tg_id)
+        await upsert_user(db_path, tg_id, f"user{tg_id}", f"Игрок {tg_id}")
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+# ---------------- BENCHMARKS ----------------
+async def bench_backup(tmp: str):
+    from backup import make_backup
+
+    db_path = os.path.join(tmp, "bench_backup.db")
+    await init_db(db_path)
+    seed_users(db_path, 200_000)
+
+    report("handler latency (idle)", await handler_latency(db_path, 300, 200_000))
+
+    backup_task = asyncio.create_task(
+        make_backup(db_path, os.path.join(tmp, "backups"), keep=2)
+    )
+    during = []
+    while not backup_task.done():
+        during += await handler_latency(db_path, 20, 200_000)
+    await backup_task
+
+    report("handler latency (backup running)", during)
+
+
+async def bench_roster(tmp: str):
+    import tracemalloc
+    import aiosqlite
+    from db import iter_active_users
+
+    db_path = os.path.join(tmp, "bench_roster.db")
+    await init_db(db_path)
+    seed_users(db_path, 100_000)
+
+    async with aiosqlite.connect(db_path) as db:
+        tracemalloc.start()
+        cur = await db.execute("SELECT tg_id, username, full_name FROM users WHERE is_active=1")
+        rows = await cur.fetchall()
+        tuples_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    del rows
+
+    tracemalloc.start()
+    users = [u async for batch in iter_active_users(db_path) for u in batch]
+    models_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    del users
+
+    tracemalloc.start()
+    streamed = 0
+    async for batch in iter_active_users(db_path):
+        streamed += len(batch)
+    stream_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"roster 100k as tuples:       peak {tuples_peak / 2**20:.1f} MiB")
+    print(f"roster 100k as User(slots):  peak {models_peak / 2**20:.1f} MiB")
+    print(f"roster 100k streamed:        peak {stream_peak / 2**20:.1f} MiB ({streamed} users)")
+
+
+async def bench_relay(tmp: str):
+    from repository import get_pair_by_child
+
+    db_path = os.path.join(tmp, "bench_relay.db")
+    await init_db(db_path)
+
+    for n in (1_000, 10_000, 100_000):
+        con = sqlite3.connect(db_path)
+        con.execute("DELETE FROM pairs")
+        con.executemany(
+            "INSERT INTO pairs(santa_id, child_id, created_at) VALUES(?, ?, '2024-01-01T00:00:00')",
+            ((i, i % n + 1) for i in range(1, n + 1))
+        )
+        con.commit()
+        con.close()
+
+        samples = []
+        for i in range(500):
+            t0 = time.perf_counter()
+            await get_pair_by_child(db_path, i * 7919 % n + 1)
+            samples.append(time.perf_counter() - t0)
+        report(f"child→santa lookup, {n} pairs", samples)
+
+
+async def bench_treasure(tmp: str):
+    from treasure import AnswerMatcher
+
+    matcher = AnswerMatcher("загадка", ["медуза", "медуза горгона", "рик санчез", "фотозона"])
+    chat = [
+        "Ребята, кто взял мой стакан?",
+        "ахахах это лучший вечер в году",
+        "по-моему это фотозоне, но я не уверен",
+        "может быть статуя в холле у входа?",
+        "Рика Санчеза видели на стене",
+    ] * 20_000
+
+    t0 = time.perf_counter()
+    for text in chat:
+        matcher.match(text)
+    elapsed = time.perf_counter() - t0
+    print(f"treasure matcher: {len(chat) / elapsed:,.0f} msg/s ({len(chat)} messages)")
+
+
+async def bench_startup(tmp: str):
+    from events import Event, prepare_event, init_events
+    from shardpool import pool
+
+    def make_event(root: str) -> Event:
+        return Event(
+            code="default",
+            organizer_id=1,
+            db_path=os.path.join(root, "bot.db"),
+            seasons_db=os.path.join(root, "seasons.db"),
+            seasons_dir=os.path.join(root, "seasons"),
+            backup_dir=os.path.join(root, "backups"),
+            tasks_file="tasks.txt",
+            emotions_file="wave_emotions.txt",
+            treasure_file="treasure.txt",
+        )
+
+    async def first_update(root: str) -> float:
+        # тот же путь, что main(): старт → первый хендлер.
+        # Пул пустой, как в только что запущенном процессе.
+        await pool.evict_idle(0)
+        t0 = time.perf_counter()
+        event = make_event(root)
+        await asyncio.gather(
+            prepare_event(event, event.db_path),
+            init_events(os.path.join(root, "events.db")),
+        )
+        await get_user_label(event.db_path, 1)
+        await upsert_user(event.db_path, 1, "user1", "Игрок 1")
+        return time.perf_counter() - t0
+
+    cold, restart = [], []
+    for i in range(30):
+        root = os.path.join(tmp, f"startup_{i}")
+        os.makedirs(root)
+        cold.append(await first_update(root))
+        restart.append(await first_update(root))
+
+    report("time to first update (new files)", cold)
+    report("time to first update (restart)", restart)
+
+
+BENCHMARKS = {
+    "backup": bench_backup,
+    "roster": bench_roster,
+    "relay": bench_relay,
+    "treasure": bench_treasure,
+    "startup": bench_startup,
+}
+
+
+async def main(names: list[str]):
+    from shardpool import pool
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for name in names or list(BENCHMARKS):
+                print(f"--- {name}")
+                await BENCHMARKS[name](tmp)
+        finally:
+            await pool.close_all()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -1,47 +1,57 @@
 import os
 import re
-import random
 import asyncio
 from datetime import datetime, timedelta
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from dotenv import load_dotenv
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from db import (
-    init_db,
     upsert_user,
     set_inactive,
-    get_active_users,
-    get_child_for_santa,
-    clear_pairs,
-    set_pair,
+    iter_active_users,
+    count_active_users,
     get_user_label,
-    load_tasks_if_empty,
     add_schedule,
     remove_schedule,
-    list_schedules,
     set_setting,
     get_setting,
     reset_waves,
-    init_wave_queue,
-    get_wave_state_full,
-    get_wave_groups,
     advance_wave,
-    clear_wave_assignments,
-    insert_wave_assignment,
-    get_wave_assignments,
-    full_reset,
-    reload_tasks_from_file, get_used_tasks, reset_used_tasks_for_group, mark_task_used,
+    reload_tasks_from_file,
 )
 
-from logic import build_secret_santa_pairs, split_into_groups_max5, make_wave_mapping
-from scheduler_jobs import job_send_random_task
-from keyboards import user_menu
+from repository import (
+    get_pair_by_santa,
+    get_pair_by_child,
+    list_schedules,
+    get_wave_state,
+    get_wave_groups,
+    get_wave_assignments,
+    list_seasons,
+)
+from backup import make_backup, needs_backup
+from delivery import send_or_mark, copy_or_mark
+from seasons import start_new_season, get_active_season_path, get_season_stats
+from scheduler_jobs import job_send_random_task, job_send_task_round
+from keyboards import user_menu, relay_reply_kb
+from treasure import AnswerMatcher
+from game import run_wave, run_santa, draw_riddle
+from replay import Recorder
+from fsm_storage import SQLiteStorage, TTLMemoryStorage, run_sweeper
+from states import GroupSay, Relay
+from singleflight import SingleFlight
+from leader import LeaderElection, bump_version, get_versions
+import profiling
+import dbtrace
+from shardpool import pool
+from events import Event, EventRouter, DEFAULT_EVENT, current_event, use_event, init_events, prepare_event
 
 # ---------------- ENV ----------------
 load_dotenv()
@@ -57,19 +67,97 @@ TASKS_FILE = os.getenv("TASKS_FILE", "tasks.txt")
 EMOTIONS_FILE = os.getenv("EMOTIONS_FILE", "wave_emotions.txt")
 TREASURE_FILE = os.getenv("TREASURE_FILE", "treasure.txt")
 
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_DB = os.getenv("FSM_DB", "fsm.db")
+FSM_TTL_SEC = int(os.getenv("FSM_TTL_SEC", "900"))
+FSM_SWEEP_SEC = int(os.getenv("FSM_SWEEP_SEC", "60"))
+FSM_MISS_TTL_SEC = int(os.getenv("FSM_MISS_TTL_SEC", "30"))
+
+SEASONS_DB = os.getenv("SEASONS_DB", "seasons.db")
+SEASONS_DIR = os.getenv("SEASONS_DIR", "seasons")
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_MIN = int(os.getenv("BACKUP_INTERVAL_MIN", "30"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "10"))
+
+# общий файл для выбора лидера среди нескольких копий бота
+LEADER_DB = os.getenv("LEADER_DB", "cluster.db")
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_RUNS = int(os.getenv("PROFILE_RUNS", "3"))
+PROFILE_TARGETS = ["run_wave", "run_santa", "job_send_random_task"]
+
+# реестр событий: одна копия бота обслуживает несколько вечеринок,
+# у каждой свой файл базы (шард) в EVENTS_DIR/<код>
+EVENTS_DB = os.getenv("EVENTS_DB", "events.db")
+EVENTS_DIR = os.getenv("EVENTS_DIR", "events")
+# сколько секунд простоя держим открытым соединение с шардом
+SHARD_IDLE_SEC = int(os.getenv("SHARD_IDLE_SEC", "300"))
+
+# запись регистраций и действий разработчика для replay.py
+REPLAY_LOG = os.getenv("REPLAY_LOG")
+
 if not BOT_TOKEN or not DEVELOPER_ID or not ORGANIZER_ID:
     raise RuntimeError("Заполни .env")
 
+MESSAGE_LIMIT = 4000
+
 # ---------------- CORE ----------------
 bot = Bot(BOT_TOKEN)
-dp = Dispatcher()
+dp = Dispatcher(
+    storage=SQLiteStorage(FSM_DB, FSM_TTL_SEC, FSM_MISS_TTL_SEC)
+    if FSM_STORAGE == "sqlite"
+    else TTLMemoryStorage(FSM_TTL_SEC)
+)
 scheduler = AsyncIOScheduler(timezone=TZ)
 
-WAITING_GROUP_MESSAGE = set()
+# событие по умолчанию — то, что настроено в .env
+events = EventRouter(EVENTS_DB, EVENTS_DIR, Event(
+    code=DEFAULT_EVENT,
+    organizer_id=ORGANIZER_ID,
+    db_path=DB_PATH,
+    seasons_db=SEASONS_DB,
+    seasons_dir=SEASONS_DIR,
+    backup_dir=BACKUP_DIR,
+    tasks_file=TASKS_FILE,
+    emotions_file=EMOTIONS_FILE,
+    treasure_file=TREASURE_FILE,
+))
+
+# outer: событие нужно уже фильтрам, не только хендлерам
+dp.message.outer_middleware(events.middleware)
+dp.callback_query.outer_middleware(events.middleware)
+
+# учёт запросов к базе по хендлерам (отчёт — кнопка «Запросы к базе»)
+dp.message.middleware(dbtrace.trace_handler_middleware)
+dp.callback_query.middleware(dbtrace.trace_handler_middleware)
+
+# защита от двойного клика и повторной доставки колбэков запуска
+LAUNCHES = SingleFlight()
+
+RECORDER = Recorder(REPLAY_LOG) if REPLAY_LOG else None
 
 # ---------------- UTILS ----------------
+def ev() -> Event:
+    # событие текущего апдейта (выставляет events.middleware)
+    return current_event()
+
+
 def is_dev(uid: int) -> bool:
-    return uid == DEVELOPER_ID
+    # организатор отдельного события управляет своим событием
+    event = ev()
+    return uid == DEVELOPER_ID or (event.code != DEFAULT_EVENT and uid == event.organizer_id)
+
+
+def record(action: str, **fields):
+    # шаг для replay.py — только то, что действительно выполнилось
+    if RECORDER:
+        RECORDER.write(ev().code, action, **fields)
+
+
+def parse_event_code(s: str):
+    code = s.strip().lower()
+    return code if re.match(r"^[a-z0-9_-]{2,32}$", code) else None
 
 
 def parse_hhmm(s: str):
@@ -79,31 +167,97 @@ def parse_hhmm(s: str):
     return int(m.group(1)), int(m.group(2))
 
 
-def read_lines(path: str) -> list[str]:
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return [x.strip() for x in f if x.strip()]
+def parse_quiet_hours(s: str):
+    # "23:00-09:00" → (минуты начала, минуты конца)
+    start, _, end = s.partition("-")
+    a, b = parse_hhmm(start), parse_hhmm(end)
+    if not a or not b:
+        return None
+    return a[0] * 60 + a[1], b[0] * 60 + b[1]
+
+
+QUIET_HOURS = parse_quiet_hours(os.getenv("QUIET_HOURS", ""))
 
 # ---------------- GROUP CHAT ----------------
 async def get_group_chat_id():
-    v = await get_setting(DB_PATH, "GROUP_CHAT_ID")
+    v = await get_setting(ev().db_path, "GROUP_CHAT_ID")
     return int(v) if v else None
 
 
 # ---------------- SCHEDULER ----------------
-async def reschedule_cron():
-    for job in scheduler.get_jobs():
-        if job.id.startswith("cron_"):
-            scheduler.remove_job(job.id)
+# Периодические задачи (cron_*, backup) ставит только лидер,
+# иначе при нескольких копиях бота каждое задание уходит несколько раз.
+# Разовые задания (dev_task_*) выполняет тот воркер, который принял клик.
+# id заданий события начинаются с его кода: "<код>:cron_HH_MM".
+
+# /schedule и heartbeat лидера могут перекладывать одно событие разом —
+# по очереди, иначе второй add_job упадёт на занятом id
+_RESCHEDULE_LOCKS: dict[str, asyncio.Lock] = {}
+
+
+async def reschedule_cron(event: Event):
+    async with _RESCHEDULE_LOCKS.setdefault(event.code, asyncio.Lock()):
+        prefix = f"{event.code}:cron_"
+        for job in scheduler.get_jobs():
+            if job.id.startswith(prefix):
+                scheduler.remove_job(job.id)
+
+        if not leader.is_leader:
+            return
+
+        # активный сезон — из seasons.db: сброс мог пройти на другом воркере
+        event.db_path = await get_active_season_path(event.seasons_db) or event.db_path
+
+        for s in await list_schedules(event.db_path):
+            if s.is_single:
+                func = job_send_random_task
+                kwargs = {
+                    "bot": bot,
+                    "db_path": event.db_path,
+                    "organizer_id": event.organizer_id,
+                    "rng": event.rng,
+                    "tz": TZ,
+                    "quiet_hours": QUIET_HOURS,
+                }
+            else:
+                func = job_send_task_round
+                kwargs = {
+                    "bot": bot,
+                    "db_path": event.db_path,
+                    "organizer_id": event.organizer_id,
+                    "recipients": s.recipients,
+                    "percent": s.percent,
+                    "window_min": s.window_min,
+                    "tz": TZ,
+                    "quiet_hours": QUIET_HOURS,
+                    "rng": event.rng,
+                }
+            scheduler.add_job(
+                func,
+                CronTrigger(hour=s.hh, minute=s.mm),
+                kwargs=kwargs,
+                id=f"{prefix}{s.hh}_{s.mm}",
+                replace_existing=True,
+            )
 
-    for hh, mm in await list_schedules(DB_PATH):
-        scheduler.add_job(
-            job_send_random_task,
-            CronTrigger(hour=hh, minute=mm),
-            kwargs={"bot": bot, "db_path": DB_PATH, "organizer_id": ORGANIZER_ID},
-            id=f"cron_{hh}_{mm}",
-        )
+
+# счётчики из общего файла, которые этот воркер уже учёл:
+# "schedule:<код>" — расписание, "season:<код>" — смена сезона,
+# "routes" — привязки чатов и игроков к событиям
+SEEN_VERSIONS: dict[str, int] = {}
+
+
+async def schedules_changed(event: Event):
+    # /schedule мог принять не лидер: отмечаем изменение в общем файле,
+    # лидер перечитает расписание на ближайшем heartbeat
+    await bump_version(LEADER_DB, f"schedule:{event.code}")
+    await reschedule_cron(event)
+
+
+async def routes_changed():
+    # /join, /start CODE и /set_group видит только принявший их воркер:
+    # остальные сбросят кэш маршрутов на ближайшем heartbeat
+    await bump_version(LEADER_DB, "routes")
 
 
 async def schedule_one_shot(seconds: int):
@@ -112,23 +266,125 @@ async def schedule_one_shot(seconds: int):
         job_send_random_task,
         "date",
         run_date=run_at,
-        kwargs={"bot": bot, "db_path": DB_PATH, "organizer_id": ORGANIZER_ID},
+        kwargs={"bot": bot, "db_path": ev().db_path, "organizer_id": ev().organizer_id, "rng": ev().rng},
     )
     return run_at
 
+async def job_backup():
+    # db_path читаем при каждом запуске: после сброса сезона файл другой.
+    # Бэкапим только базы, в которые писали после прошлого снимка.
+    for event in await events.known_events():
+        if not needs_backup(event.db_path, event.backup_dir):
+            continue
+        try:
+            await make_backup(event.db_path, event.backup_dir, BACKUP_KEEP)
+        except Exception as e:
+            await bot.send_message(DEVELOPER_ID, f"⚠️ Бэкап базы «{event.code}» не удался: {e}")
+
+
+async def on_elected():
+    SEEN_VERSIONS.update(await get_versions(LEADER_DB))
+    events.forget_routes()
+    for event in await events.known_events():
+        await reschedule_cron(event)
+    scheduler.add_job(
+        job_backup, "interval", minutes=BACKUP_INTERVAL_MIN,
+        id="backup", replace_existing=True,
+    )
+
+
+async def on_demoted():
+    for job in scheduler.get_jobs():
+        if ":cron_" in job.id:
+            scheduler.remove_job(job.id)
+    if scheduler.get_job("backup"):
+        scheduler.remove_job("backup")
+
+
+async def on_heartbeat():
+    # на такте одно чтение общего файла; по событиям идём, только если счётчик сдвинулся
+    versions = await get_versions(LEADER_DB)
+    changed = {k for k, v in versions.items() if SEEN_VERSIONS.get(k) != v}
+    SEEN_VERSIONS.update(versions)
+    if not changed:
+        return
+
+    if "routes" in changed:
+        events.forget_routes()
+
+    # каждый воркер: сезон мог смениться на другом воркере (dev_full_reset)
+    moved = await events.refresh_seasons(
+        {k.split(":", 1)[1] for k in changed if k.startswith("season:")}
+    )
+    if not leader.is_leader:
+        return
+
+    for event in moved:
+        await reschedule_cron(event)
+
+    if not any(k.startswith("schedule:") for k in changed):
+        return
+
+    for event in await events.known_events():
+        if f"schedule:{event.code}" in changed:
+            await reschedule_cron(event)
+
+
+leader = LeaderElection(LEADER_DB, on_elected, on_demoted, on_heartbeat)
+
+async def launch(call: CallbackQuery, op: str, fn):
+    task, duplicate = LAUNCHES.start(op, call.id, fn)
+    if duplicate:
+        # повторный клик/доставка: отвечаем сразу, не дожидаясь рассылки —
+        # на колбэк старше ~15 с Telegram ответить уже не даст
+        await call.answer("⏳ Уже запущено, повтор проигнорирован")
+        return
+
+    await call.answer()
+    # shield: отмена хендлера не должна обрывать рассылку на середине
+    res = await asyncio.shield(task)
+    await call.message.answer(res)
+
 # ---------------- START ----------------
+async def join_event(message: Message, code: str) -> bool:
+    """Переводит игрока в событие с кодом code (ссылка t.me/<бот>?start=CODE или /join CODE)."""
+    code = parse_event_code(code)
+    event = await events.get(code) if code else None
+    if not event:
+        await message.answer("❌ Событие с таким кодом не найдено")
+        return False
+
+    previous = ev()
+    if previous.code != event.code:
+        # игрок играет в одном событии: в прошлом он больше не активен
+        await set_inactive(previous.db_path, message.from_user.id)
+    await events.join(message.from_user.id, event)
+    await routes_changed()
+    use_event(event)
+    return True
+
+
 @dp.message(CommandStart())
-async def start_cmd(message: Message):
+async def start_cmd(message: Message, command: CommandObject):
     if message.chat.type != "private":
         await message.answer("👋 Напиши мне в личку, чтобы участвовать в игре 🙂")
         return
 
+    if command.args and not await join_event(message, command.args):
+        return
+
     await upsert_user(
-        DB_PATH,
+        ev().db_path,
         message.from_user.id,
         message.from_user.username,
         message.from_user.full_name or "",
     )
+    record(
+        "register",
+        user=message.from_user.id,
+        username=message.from_user.username,
+        full_name=message.from_user.full_name or "",
+    )
 
     await message.answer(
         "✅ Ты зарегистрирован",
@@ -136,6 +392,62 @@ async def start_cmd(message: Message):
     )
 
 
+@dp.message(Command("join"))
+async def join_cmd(message: Message, command: CommandObject):
+    if message.chat.type != "private":
+        return
+
+    if not command.args:
+        await message.answer("❗ Формат: /join КОД")
+        return
+
+    if not await join_event(message, command.args):
+        return
+
+    await upsert_user(
+        ev().db_path,
+        message.from_user.id,
+        message.from_user.username,
+        message.from_user.full_name or "",
+    )
+    record(
+        "register",
+        user=message.from_user.id,
+        username=message.from_user.username,
+        full_name=message.from_user.full_name or "",
+    )
+    await message.answer(
+        f"✅ Ты в событии «{ev().code}»",
+        reply_markup=user_menu(is_dev(message.from_user.id)),
+    )
+
+
+@dp.message(Command("new_event"))
+async def new_event_cmd(message: Message, command: CommandObject):
+    # /new_event КОД [id организатора]
+    if message.from_user.id != DEVELOPER_ID:
+        return
+
+    args = (command.args or "").split()
+    code = parse_event_code(args[0]) if args else None
+    if not code or len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+        await message.answer("❗ Формат: /new_event КОД [id организатора]\nКод: 2–32 символа a-z, 0-9, _ и -")
+        return
+
+    organizer_id = int(args[1]) if len(args) == 2 else message.from_user.id
+    event = await events.create(code, organizer_id)
+    if not event:
+        await message.answer("❌ Событие с таким кодом уже есть")
+        return
+
+    me = await bot.get_me()
+    await message.answer(
+        f"✅ Событие «{code}» создано\n"
+        f"Ссылка для игроков: https://t.me/{me.username}?start={code}\n"
+        f"В группе события: /set_group {code}"
+    )
+
+
 @dp.message(Command("menu"))
 async def menu_cmd(message: Message):
     if message.chat.type != "private":
@@ -149,41 +461,162 @@ async def menu_cmd(message: Message):
 
 
 @dp.message(Command("set_group"))
-async def set_group_cmd(message: Message):
+async def set_group_cmd(message: Message, command: CommandObject):
+    # /set_group [КОД] — без кода группа привязывается к событию по умолчанию
     if message.chat.type == "private":
         await message.answer("❗ Команда выполняется в группе")
         return
 
-    if message.from_user.id != DEVELOPER_ID:
+    code = parse_event_code(command.args) if command.args else DEFAULT_EVENT
+    event = await events.get(code) if code else None
+    if not event:
+        await message.answer("❌ Событие с таким кодом не найдено")
+        return
+
+    uid = message.from_user.id
+    if uid != DEVELOPER_ID and (event.code == DEFAULT_EVENT or uid != event.organizer_id):
         await message.answer("⛔ Нет доступа")
         return
 
-    await set_setting(DB_PATH, "GROUP_CHAT_ID", str(message.chat.id))
+    await events.bind_chat(message.chat.id, event)
+    await routes_changed()
+    await set_setting(event.db_path, "GROUP_CHAT_ID", str(message.chat.id))
     await message.answer("✅ Группа успешно привязана")
 
 
+@dp.message(Command("schedule"))
+async def schedule_cmd(message: Message):
+    # /schedule HH:MM [K | P%] [окно_мин]
+    if not is_dev(message.from_user.id):
+        return
+
+    args = (message.text or "").split()[1:]
+    if not args:
+        rows = await list_schedules(ev().db_path)
+        if not rows:
+            await message.answer("🗓 Расписание пустое.\n/schedule HH:MM [K | P%] [окно_мин]")
+            return
+        lines = []
+        for s in rows:
+            who = f"{s.percent}%" if s.percent else f"{s.recipients} чел."
+            lines.append(f"• {s.hh:02d}:{s.mm:02d} — {who}, окно {s.window_min} мин")
+        await message.answer("🗓 Расписание:\n" + "\n".join(lines))
+        return
+
+    t = parse_hhmm(args[0])
+    if not t:
+        await message.answer("❗ Формат: /schedule HH:MM [K | P%] [окно_мин]")
+        return
+
+    recipients, percent, window_min = 1, None, 0
+    try:
+        if len(args) > 1:
+            if args[1].endswith("%"):
+                percent = max(1, min(100, int(args[1][:-1])))
+            else:
+                recipients = max(1, int(args[1]))
+        if len(args) > 2:
+            window_min = max(0, int(args[2]))
+    except ValueError:
+        await message.answer("❗ Формат: /schedule HH:MM [K | P%] [окно_мин]")
+        return
+
+    await add_schedule(ev().db_path, t[0], t[1], recipients, percent, window_min)
+    await schedules_changed(ev())
+    await message.answer(f"✅ Раунд в {t[0]:02d}:{t[1]:02d} добавлен")
+
+
+@dp.message(Command("unschedule"))
+async def unschedule_cmd(message: Message):
+    if not is_dev(message.from_user.id):
+        return
+
+    args = (message.text or "").split()[1:]
+    t = parse_hhmm(args[0]) if args else None
+    if not t:
+        await message.answer("❗ Формат: /unschedule HH:MM")
+        return
+
+    await remove_schedule(ev().db_path, t[0], t[1])
+    await schedules_changed(ev())
+    await message.answer(f"🗑 Раунд в {t[0]:02d}:{t[1]:02d} удалён")
+
+
 # ---------------- DELETE ----------------
 @dp.callback_query(F.data == "delete_me")
 async def delete_me(call: CallbackQuery):
-    await set_inactive(DB_PATH, call.from_user.id)
+    await set_inactive(ev().db_path, call.from_user.id)
+    record("leave", user=call.from_user.id)
     await call.message.answer("❌ Удалён из игры")
 
+# ---------------- RELAY ----------------
+@dp.callback_query(F.data.in_(["relay_to_child", "relay_to_santa"]))
+async def relay_start(call: CallbackQuery, state: FSMContext):
+    if call.message.chat.type != "private":
+        return
+
+    if call.data == "relay_to_child":
+        pair = await get_pair_by_santa(ev().db_path, call.from_user.id)
+        peer = pair.child_id if pair else None
+        prompt = "✍️ Напиши сообщение — подопечный получит его анонимно"
+    else:
+        pair = await get_pair_by_child(ev().db_path, call.from_user.id)
+        peer = pair.santa_id if pair else None
+        prompt = "✍️ Напиши сообщение — оно уйдёт твоему Тайному Санте"
+
+    if not peer:
+        await call.message.answer("🎅 Санта ещё не запускался.")
+        return
+
+    await state.set_state(Relay.to_child if call.data == "relay_to_child" else Relay.to_santa)
+    await call.message.answer(prompt)
+
+
+@dp.message(Relay.to_child, F.chat.type == "private")
+@dp.message(Relay.to_santa, F.chat.type == "private")
+async def relay_message(message: Message, state: FSMContext):
+    direction = await state.get_state()
+    await state.clear()
+
+    if direction == Relay.to_child.state:
+        pair = await get_pair_by_santa(ev().db_path, message.from_user.id)
+        peer = pair.child_id if pair else None
+        header = "💌 Сообщение от твоего Тайного Санты:"
+        reply_direction = "to_santa"
+    else:
+        pair = await get_pair_by_child(ev().db_path, message.from_user.id)
+        peer = pair.santa_id if pair else None
+        header = "💌 Сообщение от подопечного:"
+        reply_direction = "to_child"
+
+    if not peer:
+        await message.answer("🎅 Пара больше не существует.")
+        return
+
+    delivered = await send_or_mark(bot, ev().db_path, peer, header)
+    if delivered:
+        delivered = await copy_or_mark(
+            bot, ev().db_path, peer, message,
+            reply_markup=relay_reply_kb(reply_direction),
+        )
+
+    if not delivered:
+        await message.answer("🚫 Не получилось доставить: собеседник заблокировал бота.")
+        return
+
+    await message.answer("✅ Доставлено анонимно")
+
 # ---------------- SAY TO GROUP ----------------
 @dp.callback_query(F.data == "dev_say_group")
-async def dev_say_group(call: CallbackQuery):
+async def dev_say_group(call: CallbackQuery, state: FSMContext):
     if not is_dev(call.from_user.id):
         return
-    WAITING_GROUP_MESSAGE.add(call.from_user.id)
+    await state.set_state(GroupSay.waiting_text)
     await call.message.answer("✍️ Напиши текст — он уйдёт в группу")
 
-@dp.message()
-async def catch_group_text(message: Message):
-    if message.from_user.id not in WAITING_GROUP_MESSAGE:
-        return
-    if message.chat.type != "private":
-        return
-
-    WAITING_GROUP_MESSAGE.remove(message.from_user.id)
+@dp.message(GroupSay.waiting_text, F.chat.type == "private")
+async def say_group_text(message: Message, state: FSMContext):
+    await state.clear()
     gid = await get_group_chat_id()
     if not gid:
         await message.answer("❌ Группа не привязана")
@@ -208,90 +641,43 @@ async def task_delay(call: CallbackQuery):
     await call.message.answer(f"⏰ Задание будет отправлено в {run_at.strftime('%H:%M:%S')}")
 
 # ---------------- WAVES ----------------
-async def pick_task_for_user(db_path: str, user_id: int, group_idx: int, tasks: list[str]) -> str:
-    used = await get_used_tasks(db_path, user_id, group_idx)
-    available = [t for t in tasks if t not in used]
-
-    if not available:
-        await reset_used_tasks_for_group(db_path, group_idx)
-        available = tasks
-
-    task = random.choice(available)
-    await mark_task_used(db_path, user_id, group_idx, task)
-    return task
-
-
-
-async def run_wave():
-    users = await get_active_users(DB_PATH)
-    if len(users) < 4:
-        return "⛔ Мало игроков"
-
-    wave_index, active_idx, is_init = await get_wave_state_full(DB_PATH)
-
-    if not is_init:
-        ids = [u[0] for u in users]
-        random.shuffle(ids)
-        await init_wave_queue(DB_PATH, split_into_groups_max5(ids))
-        wave_index, active_idx, _ = await get_wave_state_full(DB_PATH)
-
-    groups = await get_wave_groups(DB_PATH)
-    active = groups[active_idx]
-    passive = groups[(active_idx + 1) % len(groups)]
-
-    tasks = read_lines(EMOTIONS_FILE)
-    pairs = make_wave_mapping(active, passive)
-
-    log = [f"🌊 Волна {wave_index} запущена"]
-
-    for a_id, t_id in pairs:
-        task = await pick_task_for_user(DB_PATH, a_id, active_idx, tasks)
-
-        await bot.send_message(
-            a_id,
-            f"🎯 *Твоя цель (если в задании это предусмотрено)*: {await get_user_label(DB_PATH, t_id)}\n\n"
-            f"*Задание:*\n{task}"
-        )
-
-        log.append(
-            f"{await get_user_label(DB_PATH, a_id)} → "
-            f"{await get_user_label(DB_PATH, t_id)} | {task}"
-        )
-
-    # сообщение разработчику
-    await bot.send_message(
-        DEVELOPER_ID,
-        "🚀 " + "\n".join(log)
-    )
+@dp.callback_query(F.data == "dev_wave_run")
+async def wave_run(call: CallbackQuery):
+    if not is_dev(call.from_user.id):
+        return
 
-    return f"✅ Волна {wave_index} запущена"
+    event = ev()
 
+    async def wave():
+        record("wave")
+        return await run_wave(bot, event, DEVELOPER_ID)
 
-@dp.callback_query(F.data == "dev_wave_run")
-async def wave_run(call: CallbackQuery):
-    await call.message.answer(await run_wave())
+    await launch(call, f"{event.code}:wave", wave)
 
 @dp.callback_query(F.data == "dev_users")
 async def dev_users(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    users = await get_active_users(DB_PATH)
-    if not users:
+    # список уходит кусками по мере чтения: и ростер целиком в памяти
+    # не держим, и в лимит длины сообщения Telegram укладываемся
+    header = "👥 Список игроков:\n\n"
+    chunk = header
+    sent_any = False
+    async for batch in iter_active_users(ev().db_path):
+        for u in batch:
+            line = f"• {u.label} [{u.tg_id}]\n"
+            if len(chunk) + len(line) > MESSAGE_LIMIT:
+                await call.message.answer(chunk)
+                chunk = ""
+            chunk += line
+            sent_any = True
+
+    if not sent_any:
         await call.message.answer("👥 Активных игроков нет.")
         return
-
-    lines = []
-    for tg_id, username, full_name in users:
-        line = f"• {full_name}"
-        if username:
-            line += f" (@{username})"
-        line += f" [{tg_id}]"
-        lines.append(line)
-
-    await call.message.answer(
-        "👥 Список игроков:\n\n" + "\n".join(lines)
-    )
+    if chunk:
+        await call.message.answer(chunk)
 
 
 @dp.callback_query(F.data == "dev_status")
@@ -299,17 +685,19 @@ async def dev_status(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    users = await get_active_users(DB_PATH)
-    groups = await get_wave_groups(DB_PATH)
-    wave_index, active_idx, is_init = await get_wave_state_full(DB_PATH)
-    chat_id = await get_setting(DB_PATH, "GROUP_CHAT_ID")
+    users_count = await count_active_users(ev().db_path)
+    groups = await get_wave_groups(ev().db_path)
+    state = await get_wave_state(ev().db_path)
+    assignments = await get_wave_assignments(ev().db_path, state.wave_index)
+    chat_id = await get_setting(ev().db_path, "GROUP_CHAT_ID")
 
     msg = (
         "📊 *Статус игры*\n\n"
-        f"👥 Игроков: {len(users)}\n"
+        f"👥 Игроков: {users_count}\n"
         f"🌊 Групп: {len(groups)}\n"
-        f"🌊 Волна: {wave_index}\n"
-        f"🔥 ACTIVE группа: {active_idx + 1 if is_init else '-'}\n"
+        f"🌊 Волна: {state.wave_index}\n"
+        f"🔥 ACTIVE группа: {state.active_group_idx + 1 if state.is_initialized else '-'}\n"
+        f"🎯 Заданий в волне: {len(assignments)}\n"
         f"💬 Группа привязана: {'да' if chat_id else 'нет'}"
     )
 
@@ -325,12 +713,18 @@ async def dev_treasure(call: CallbackQuery):
         await call.message.answer("❌ Группа не привязана (/set_group)")
         return
 
-    riddles = read_lines(TREASURE_FILE)
-    if not riddles:
+    drawn = draw_riddle(ev())
+    if not drawn:
         await call.message.answer("⚠️ treasure.txt пуст.")
         return
+    record("treasure")
+
+    riddle, answers = drawn
+    if not answers:
+        await call.message.answer("⚠️ У загадки нет ответов (формат: загадка | ответ1; ответ2).")
+        return
 
-    riddle = random.choice(riddles)
+    ev().treasure = AnswerMatcher(riddle, answers)
 
     await bot.send_message(
         gid,
@@ -338,18 +732,38 @@ async def dev_treasure(call: CallbackQuery):
         parse_mode="Markdown"
     )
 
+
+@dp.message(
+    F.chat.type.in_({"group", "supergroup"}),
+    F.text,
+    lambda m: ev().treasure is not None,
+)
+async def treasure_answer(message: Message):
+    event = ev()
+    matcher = event.treasure
+    answer = matcher.match(message.text)
+    if not answer:
+        return
+
+    # первый правильный ответ закрывает событие
+    event.treasure = None
+    winner = message.from_user.full_name + (f" (@{message.from_user.username})" if message.from_user.username else "")
+
+    await message.reply(f"🏆 {winner} первым разгадал загадку!\nОтвет: {answer}")
+    await bot.send_message(DEVELOPER_ID, f"🪙 Золотоискатель: победил {winner}, ответ «{answer}»")
+
 # ---------------- бля ----------------
 @dp.callback_query(F.data == "santa_me")
 async def santa_me(call: CallbackQuery):
     if call.message.chat.type != "private":
         return
 
-    child_id = await get_child_for_santa(DB_PATH, call.from_user.id)
-    if not child_id:
+    pair = await get_pair_by_santa(ev().db_path, call.from_user.id)
+    if not pair:
         await call.message.answer("🎅 Санта ещё не запускался.")
         return
 
-    label = await get_user_label(DB_PATH, child_id)
+    label = await get_user_label(ev().db_path, pair.child_id)
     await call.message.answer(
         f"🎁 Твой подопечный:\n{label}\n\nНикому не рассказывай 😉"
     )
@@ -359,37 +773,13 @@ async def dev_santa_start(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    users = await get_active_users(DB_PATH)
-    if len(users) < 2:
-        await call.message.answer("⛔ Нужно минимум 2 игрока.")
-        return
-
-    ids = [u[0] for u in users]
-    pairs = build_secret_santa_pairs(ids)
+    event = ev()
 
-    await clear_pairs(DB_PATH)
-    for s, c in pairs.items():
-        await set_pair(DB_PATH, s, c)
-
-    # лички
-    for s, c in pairs.items():
-        try:
-            await bot.send_message(
-                s,
-                f"🎅 Твой подопечный:\n{await get_user_label(DB_PATH, c)}"
-            )
-        except:
-            pass
-
-    # организатор
-    log = ["🎅 Санта запущен:"]
-    for s, c in pairs.items():
-        log.append(
-            f"{await get_user_label(DB_PATH, s)} → {await get_user_label(DB_PATH, c)}"
-        )
+    async def santa():
+        record("santa")
+        return await run_santa(bot, event)
 
-    await bot.send_message(ORGANIZER_ID, "\n".join(log))
-    await call.message.answer("✅ Санта запущен.")
+    await launch(call, f"{event.code}:santa", santa)
 
 
 @dp.callback_query(F.data == "dev_wave_next")
@@ -397,9 +787,15 @@ async def dev_wave_next(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    await advance_wave(DB_PATH)
-    res = await run_wave()
-    await call.message.answer(res)
+    event = ev()
+
+    async def next_wave():
+        record("wave_next")
+        await advance_wave(event.db_path)
+        return await run_wave(bot, event, DEVELOPER_ID)
+
+    # та же операция "wave": следующая волна не стартует поверх текущей
+    await launch(call, f"{event.code}:wave", next_wave)
 
 
 @dp.callback_query(F.data == "dev_wave_reset")
@@ -407,7 +803,8 @@ async def dev_wave_reset(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    await reset_waves(DB_PATH)
+    await reset_waves(ev().db_path)
+    record("wave_reset")
     await call.message.answer("🔄 Волны сброшены. Очередь будет пересобрана.")
 
 
@@ -416,8 +813,33 @@ async def dev_full_reset(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    await full_reset(DB_PATH)
-    await call.message.answer("🧹 Полный сброс выполнен.")
+    # новый сезон вместо DELETE по всем таблицам; старый уходит в архив
+    event = ev()
+    event.db_path = await start_new_season(event.seasons_db, event.seasons_dir, event.tasks_file)
+    record("season")
+    await bump_version(LEADER_DB, f"season:{event.code}")
+    await reschedule_cron(event)
+    await call.message.answer("🧹 Полный сброс выполнен. Прошлый сезон сохранён в архиве.")
+
+
+@dp.callback_query(F.data == "dev_seasons")
+async def dev_seasons(call: CallbackQuery):
+    if not is_dev(call.from_user.id):
+        return
+
+    lines = []
+    for season in await list_seasons(ev().seasons_db):
+        stats = await get_season_stats(season.db_path)
+        line = f"• #{season.id} {season.started_at[:16]}"
+        line += " (активный)" if season.is_active else f" → {season.archived_at[:16]}"
+        if stats:
+            line += (
+                f"\n   👥 {stats['users']} | 🎅 {stats['pairs']}"
+                f" | 📌 {stats['sent_tasks']} | 🌊 {stats['wave_assignments']}"
+            )
+        lines.append(line)
+
+    await call.message.answer("📚 Сезоны:\n\n" + "\n".join(lines))
 
 
 @dp.callback_query(F.data == "dev_reload_tasks")
@@ -425,24 +847,92 @@ async def dev_reload_tasks(call: CallbackQuery):
     if not is_dev(call.from_user.id):
         return
 
-    count = await reload_tasks_from_file(DB_PATH, TASKS_FILE)
-    if count == 0:
+    report = await reload_tasks_from_file(ev().db_path, ev().tasks_file)
+    if report is None:
         await call.message.answer("⚠️ Файл заданий пуст или отсутствует.")
-    else:
-        await call.message.answer(f"✅ Задания перезагружены: {count} шт.")
+        return
+
+    added, removed, unchanged = report
+    await call.message.answer(
+        "✅ Задания перезагружены:\n"
+        f"➕ добавлено: {added}\n"
+        f"➖ убрано: {removed}\n"
+        f"= без изменений: {unchanged}"
+    )
+
+
+
+
+
+
+@dp.callback_query(F.data == "dev_backup")
+async def dev_backup(call: CallbackQuery):
+    if not is_dev(call.from_user.id):
+        return
+
+    await call.message.answer("💾 Бэкап запущен…")
+    try:
+        path = await make_backup(ev().db_path, ev().backup_dir, BACKUP_KEEP)
+    except Exception as e:
+        await call.message.answer(f"⚠️ Бэкап не удался: {e}")
+        return
 
+    await call.message.answer(f"✅ Бэкап готов и проверен: {os.path.basename(path)}")
 
 
+# ---------------- PROFILING ----------------
+async def send_profile(summary: str, paths: list[str]):
+    await bot.send_message(DEVELOPER_ID, summary)
+    for path in paths:
+        await bot.send_document(DEVELOPER_ID, FSInputFile(path))
 
 
+@dp.callback_query(F.data == "dev_profile")
+async def dev_profile(call: CallbackQuery):
+    if not is_dev(call.from_user.id):
+        return
+
+    if profiling.armed():
+        profiling.disarm()
+        await call.message.answer("🔬 Профилирование выключено.")
+        return
+
+    profiling.arm(PROFILE_TARGETS, PROFILE_RUNS, PROFILE_DIR, send_profile)
+    await call.message.answer(
+        f"🔬 Профилирую следующие {PROFILE_RUNS} вызова: " + ", ".join(PROFILE_TARGETS)
+        + "\nФайлы .pstats и .folded придут сюда."
+    )
+
+
+@dp.callback_query(F.data == "dev_db_trace")
+async def dev_db_trace(call: CallbackQuery):
+    if not is_dev(call.from_user.id):
+        return
+
+    await call.message.answer(dbtrace.report())
+
 
 # ---------------- MAIN ----------------
 async def main():
-    await init_db(DB_PATH)
-    await load_tasks_if_empty(DB_PATH, TASKS_FILE)
-    await reschedule_cron()
+    # шаги старта друг от друга не зависят — идут одновременно
+    await asyncio.gather(
+        prepare_event(events.default, events.default.db_path),
+        init_events(EVENTS_DB),
+    )
     scheduler.start()
-    await dp.start_polling(bot)
+    # апдейты обрабатывают все воркеры, планировщик — только лидер
+    background = [
+        asyncio.create_task(leader.run()),
+        asyncio.create_task(pool.run_evictor(SHARD_IDLE_SEC)),
+        asyncio.create_task(run_sweeper(dp.storage, FSM_SWEEP_SEC)),
+    ]
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await pool.close_all()
 
 if __name__ == "__main__":
     asyncio.run(main())
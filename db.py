@@ -1,10 +1,25 @@
-import aiosqlite
+import random
+import asyncio
+import hashlib
+import dbtrace
 from datetime import datetime
 
+from models import User, user_row
+
 
 # ---------------- BASE INIT ----------------
+# версия схемы в PRAGMA user_version: поднимать при каждом изменении init_db
+SCHEMA_VERSION = 1
+
+
 async def init_db(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
+        # схема уже актуальна — на старте ни CREATE, ни PRAGMA table_info
+        cur = await db.execute("PRAGMA user_version")
+        (version,) = await cur.fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS users(
             tg_id INTEGER PRIMARY KEY,
@@ -21,19 +36,46 @@ async def init_db(db_path: str):
             created_at TEXT NOT NULL
         )""")
 
+        # обратный поиск подопечный → санта для анонимной переписки
+        await db.execute("CREATE INDEX IF NOT EXISTS pairs_child ON pairs(child_id)")
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS tasks(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            text TEXT NOT NULL
+            text TEXT NOT NULL,
+            hash TEXT,
+            retired INTEGER NOT NULL DEFAULT 0
         )""")
 
+        # старые базы: колонки для инкрементальной перезагрузки заданий
+        cur = await db.execute("PRAGMA table_info(tasks)")
+        task_cols = {r[1] for r in await cur.fetchall()}
+        if "hash" not in task_cols:
+            await db.execute("ALTER TABLE tasks ADD COLUMN hash TEXT")
+        if "retired" not in task_cols:
+            await db.execute("ALTER TABLE tasks ADD COLUMN retired INTEGER NOT NULL DEFAULT 0")
+        await db.execute("CREATE INDEX IF NOT EXISTS tasks_hash ON tasks(hash)")
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS schedules(
             hh INTEGER NOT NULL,
             mm INTEGER NOT NULL,
+            recipients INTEGER NOT NULL DEFAULT 1,
+            percent INTEGER,
+            window_min INTEGER NOT NULL DEFAULT 0,
             PRIMARY KEY(hh, mm)
         )""")
 
+        # старые базы: параметры раунда (сколько игроков и за какое окно)
+        cur = await db.execute("PRAGMA table_info(schedules)")
+        schedule_cols = {r[1] for r in await cur.fetchall()}
+        if "recipients" not in schedule_cols:
+            await db.execute("ALTER TABLE schedules ADD COLUMN recipients INTEGER NOT NULL DEFAULT 1")
+        if "percent" not in schedule_cols:
+            await db.execute("ALTER TABLE schedules ADD COLUMN percent INTEGER")
+        if "window_min" not in schedule_cols:
+            await db.execute("ALTER TABLE schedules ADD COLUMN window_min INTEGER NOT NULL DEFAULT 0")
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS sent_tasks(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -83,12 +125,13 @@ async def init_db(db_path: str):
         UNIQUE(user_id, group_id, task)
          )""")
 
+        await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         await db.commit()
 
 
 # ---------------- USERS ----------------
 async def upsert_user(db_path: str, tg_id: int, username: str | None, full_name: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("""
         INSERT INTO users(tg_id, username, full_name, is_active, created_at)
         VALUES(?, ?, ?, 1, ?)
@@ -101,25 +144,77 @@ async def upsert_user(db_path: str, tg_id: int, username: str | None, full_name:
 
 
 async def set_inactive(db_path: str, tg_id: int):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("UPDATE users SET is_active=0 WHERE tg_id=?", (tg_id,))
         await db.execute("DELETE FROM pairs WHERE santa_id=? OR child_id=?", (tg_id, tg_id))
         await db.commit()
 
 
-async def get_active_users(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
+async def set_undeliverable(db_path: str, tg_id: int):
+    # бот заблокирован: выключаем из рассылок, но пары не трогаем
+    async with dbtrace.connect(db_path) as db:
+        await db.execute("UPDATE users SET is_active=0 WHERE tg_id=?", (tg_id,))
+        await db.commit()
+
+
+async def _active_users_page(db_path: str, after_id: int, limit: int) -> list[User]:
+    # keyset по первичному ключу: диапазон rowid, без сортировки всей таблицы
+    async with dbtrace.connect(db_path) as db:
+        db.row_factory = user_row
         cur = await db.execute("""
         SELECT tg_id, username, full_name
         FROM users
-        WHERE is_active=1
-        ORDER BY created_at
-        """)
+        WHERE tg_id > ? AND is_active=1
+        ORDER BY tg_id
+        LIMIT ?
+        """, (after_id, limit))
         return await cur.fetchall()
 
 
+async def iter_active_users(db_path: str, batch_size: int = 1000):
+    """
+    Ростер пачками, без fetchall всего списка.
+    Каждая пачка — отдельный короткий запрос: между пачками курсор
+    не открыт, и вызывающий может спокойно ждать Telegram, не блокируя запись.
+    Следующая пачка читается в фоне, пока вызывающий обрабатывает текущую.
+    """
+    pending = asyncio.ensure_future(_active_users_page(db_path, 0, batch_size))
+    try:
+        while True:
+            batch = await pending
+            if not batch:
+                return
+            if len(batch) < batch_size:
+                yield batch
+                return
+            pending = asyncio.ensure_future(_active_users_page(db_path, batch[-1].tg_id, batch_size))
+            yield batch
+    finally:
+        if not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+
+
+async def count_active_users(db_path: str) -> int:
+    async with dbtrace.connect(db_path) as db:
+        cur = await db.execute("SELECT COUNT(*) FROM users WHERE is_active=1")
+        (cnt,) = await cur.fetchone()
+        return cnt
+
+
+async def filter_active_ids(db_path: str, ids: list[int]) -> set[int]:
+    if not ids:
+        return set()
+    async with dbtrace.connect(db_path) as db:
+        cur = await db.execute(
+            f"SELECT tg_id FROM users WHERE is_active=1 AND tg_id IN ({','.join('?' * len(ids))})",
+            ids
+        )
+        return {r[0] for r in await cur.fetchall()}
+
+
 async def get_user_label(db_path: str, tg_id: int) -> str:
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         cur = await db.execute(
             "SELECT username, full_name FROM users WHERE tg_id=?",
             (tg_id,)
@@ -135,13 +230,13 @@ async def get_user_label(db_path: str, tg_id: int) -> str:
 
 # ---------------- SANTA ----------------
 async def clear_pairs(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("DELETE FROM pairs")
         await db.commit()
 
 
 async def set_pair(db_path: str, santa_id: int, child_id: int):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("""
         INSERT INTO pairs(santa_id, child_id, created_at)
         VALUES(?, ?, ?)
@@ -152,23 +247,17 @@ async def set_pair(db_path: str, santa_id: int, child_id: int):
         await db.commit()
 
 
-async def get_child_for_santa(db_path: str, santa_id: int):
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute(
-            "SELECT child_id FROM pairs WHERE santa_id=?",
-            (santa_id,)
-        )
-        row = await cur.fetchone()
-        return row[0] if row else None
+# ---------------- TASKS ----------------
+def task_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
 
-# ---------------- TASKS ----------------
 async def load_tasks_if_empty(db_path: str, tasks_file: str):
     import os
     if not os.path.exists(tasks_file):
         return
 
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         cur = await db.execute("SELECT COUNT(*) FROM tasks")
         (cnt,) = await cur.fetchone()
         if cnt > 0:
@@ -181,23 +270,30 @@ async def load_tasks_if_empty(db_path: str, tasks_file: str):
             return
 
         await db.executemany(
-            "INSERT INTO tasks(text) VALUES(?)",
-            [(t,) for t in lines]
+            "INSERT INTO tasks(text, hash) VALUES(?, ?)",
+            [(t, task_hash(t)) for t in lines]
         )
         await db.commit()
 
 
-async def get_random_task(db_path: str) -> str | None:
-    async with aiosqlite.connect(db_path) as db:
+async def get_random_task(db_path: str, rng: random.Random | None = None) -> str | None:
+    # номер задания выбирает rng, а не ORDER BY RANDOM(): выбор воспроизводим по сиду
+    async with dbtrace.connect(db_path) as db:
+        cur = await db.execute("SELECT COUNT(*) FROM tasks WHERE retired=0")
+        (cnt,) = await cur.fetchone()
+        if not cnt:
+            return None
+
         cur = await db.execute(
-            "SELECT text FROM tasks ORDER BY RANDOM() LIMIT 1"
+            "SELECT text FROM tasks WHERE retired=0 ORDER BY id LIMIT 1 OFFSET ?",
+            ((rng or random).randrange(cnt),)
         )
         row = await cur.fetchone()
         return row[0] if row else None
 
 
 async def log_sent_task(db_path: str, tg_id: int, task_text: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute(
             "INSERT INTO sent_tasks(tg_id, task_text, sent_at) VALUES(?,?,?)",
             (tg_id, task_text, datetime.utcnow().isoformat())
@@ -206,17 +302,28 @@ async def log_sent_task(db_path: str, tg_id: int, task_text: str):
 
 
 # ---------------- SCHEDULE ----------------
-async def add_schedule(db_path: str, hh: int, mm: int):
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO schedules(hh, mm) VALUES(?,?)",
-            (hh, mm)
-        )
+async def add_schedule(
+    db_path: str,
+    hh: int,
+    mm: int,
+    recipients: int = 1,
+    percent: int | None = None,
+    window_min: int = 0,
+):
+    async with dbtrace.connect(db_path) as db:
+        await db.execute("""
+        INSERT INTO schedules(hh, mm, recipients, percent, window_min)
+        VALUES(?,?,?,?,?)
+        ON CONFLICT(hh, mm) DO UPDATE SET
+            recipients=excluded.recipients,
+            percent=excluded.percent,
+            window_min=excluded.window_min
+        """, (hh, mm, recipients, percent, window_min))
         await db.commit()
 
 
 async def remove_schedule(db_path: str, hh: int, mm: int):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute(
             "DELETE FROM schedules WHERE hh=? AND mm=?",
             (hh, mm)
@@ -224,17 +331,9 @@ async def remove_schedule(db_path: str, hh: int, mm: int):
         await db.commit()
 
 
-async def list_schedules(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute(
-            "SELECT hh, mm FROM schedules ORDER BY hh, mm"
-        )
-        return await cur.fetchall()
-
-
 # ---------------- SETTINGS ----------------
 async def set_setting(db_path: str, key: str, value: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("""
         INSERT INTO settings(key, value) VALUES(?,?)
         ON CONFLICT(key) DO UPDATE SET value=excluded.value
@@ -243,7 +342,7 @@ async def set_setting(db_path: str, key: str, value: str):
 
 
 async def get_setting(db_path: str, key: str) -> str | None:
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         cur = await db.execute(
             "SELECT value FROM settings WHERE key=?",
             (key,)
@@ -253,8 +352,11 @@ async def get_setting(db_path: str, key: str) -> str | None:
 
 
 # ---------------- WAVES (FIXED QUEUE) ----------------
+# Сброс волн удаляет группы и назначения и откатывает строку состояния.
+# Это обычный DELETE по двум таблицам — время растёт с их размером;
+# без него dev_status показывал бы группы прошлой очереди.
 async def reset_waves(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("DELETE FROM wave_groups")
         await db.execute("DELETE FROM wave_assignments")
         await db.execute("""
@@ -269,8 +371,9 @@ async def reset_waves(db_path: str):
 
 
 async def init_wave_queue(db_path: str, groups: list[list[int]]):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute("DELETE FROM wave_groups")
+        await db.execute("DELETE FROM wave_assignments")
 
         for g_idx, group in enumerate(groups):
             for pos, tg_id in enumerate(group):
@@ -290,33 +393,8 @@ async def init_wave_queue(db_path: str, groups: list[list[int]]):
         await db.commit()
 
 
-async def get_wave_state_full(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute("""
-            SELECT wave_index, active_group_idx, is_initialized
-            FROM wave_state WHERE id=1
-        """)
-        row = await cur.fetchone()
-        return row if row else (0, 0, 0)
-
-
-async def get_wave_groups(db_path: str) -> dict[int, list[int]]:
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute("""
-            SELECT group_idx, tg_id
-            FROM wave_groups
-            ORDER BY group_idx, position
-        """)
-        rows = await cur.fetchall()
-
-    groups: dict[int, list[int]] = {}
-    for g_idx, tg_id in rows:
-        groups.setdefault(g_idx, []).append(tg_id)
-    return groups
-
-
 async def advance_wave(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         cur = await db.execute(
             "SELECT active_group_idx FROM wave_state WHERE id=1"
         )
@@ -338,52 +416,68 @@ async def advance_wave(db_path: str):
         await db.commit()
 
 
-# ---------------- FULL RESET ----------------
-async def full_reset(db_path: str):
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute("DELETE FROM users")
-        await db.execute("DELETE FROM pairs")
-        await db.execute("DELETE FROM wave_groups")
-        await db.execute("DELETE FROM wave_assignments")
-        await db.execute("DELETE FROM sent_tasks")
-        await db.execute("DELETE FROM schedules")
-        await db.execute("DELETE FROM settings")
-
-        await db.execute("""
-            INSERT INTO wave_state(id, wave_index, active_group_idx, is_initialized)
-            VALUES (1, 0, 0, 0)
-            ON CONFLICT(id) DO UPDATE SET
-                wave_index=0,
-                active_group_idx=0,
-                is_initialized=0
-        """)
-        await db.commit()
-
-async def reload_tasks_from_file(db_path: str, tasks_file: str) -> int:
+async def reload_tasks_from_file(db_path: str, tasks_file: str) -> tuple[int, int, int] | None:
+    """
+    Инкрементальная перезагрузка: сравниваем хэши строк файла с базой,
+    добавляем только новые задания и выключаем (retired) удалённые.
+    id существующих заданий не меняются, всё применяется одной транзакцией.
+    Возвращает (добавлено, убрано, без изменений) или None, если файл пуст.
+    """
     import os
     if not os.path.exists(tasks_file):
-        return 0
+        return None
 
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute("DELETE FROM tasks")
+    with open(tasks_file, "r", encoding="utf-8") as f:
+        lines = [x.strip() for x in f if x.strip()]
 
-        with open(tasks_file, "r", encoding="utf-8") as f:
-            lines = [x.strip() for x in f if x.strip()]
+    if not lines:
+        return None
 
-        if not lines:
-            await db.commit()
-            return 0
+    wanted = {task_hash(t): t for t in lines}
+
+    async with dbtrace.connect(db_path) as db:
+        await db.execute("BEGIN IMMEDIATE")
+
+        # задания, загруженные до появления колонки hash
+        cur = await db.execute("SELECT id, text FROM tasks WHERE hash IS NULL")
+        legacy = await cur.fetchall()
+        if legacy:
+            await db.executemany(
+                "UPDATE tasks SET hash=? WHERE id=?",
+                [(task_hash(text), task_id) for task_id, text in legacy]
+            )
+
+        cur = await db.execute("SELECT hash, retired FROM tasks")
+        current = {h: retired for h, retired in await cur.fetchall()}
+
+        live = {h for h, retired in current.items() if not retired}
+        added = [h for h in wanted if h not in current]
+        revived = [h for h in wanted if current.get(h) == 1]
+        removed = [h for h in live if h not in wanted]
+
+        if added:
+            await db.executemany(
+                "INSERT INTO tasks(text, hash) VALUES(?, ?)",
+                [(wanted[h], h) for h in added]
+            )
+        if revived:
+            await db.executemany(
+                "UPDATE tasks SET retired=0 WHERE hash=?",
+                [(h,) for h in revived]
+            )
+        if removed:
+            await db.executemany(
+                "UPDATE tasks SET retired=1 WHERE hash=?",
+                [(h,) for h in removed]
+            )
 
-        await db.executemany(
-            "INSERT INTO tasks(text) VALUES(?)",
-            [(t,) for t in lines]
-        )
         await db.commit()
-        return len(lines)
+
+    return len(added) + len(revived), len(removed), len(wanted) - len(added) - len(revived)
 
 # ---------------- WAVE ASSIGNMENTS ----------------
 async def clear_wave_assignments(db_path: str, wave_index: int):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute(
             "DELETE FROM wave_assignments WHERE wave_index=?",
             (wave_index,)
@@ -398,7 +492,7 @@ async def insert_wave_assignment(
     target_id: int,
     emotion: str
 ):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute(
             """
             INSERT INTO wave_assignments(
@@ -411,22 +505,10 @@ async def insert_wave_assignment(
         await db.commit()
 
 
-async def get_wave_assignments(db_path: str, wave_index: int):
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute(
-            """
-            SELECT active_id, target_id, emotion
-            FROM wave_assignments
-            WHERE wave_index=?
-            """,
-            (wave_index,)
-        )
-        return await cur.fetchall()
-
 async def get_used_tasks(db_path: str, user_id: int, group_idx: int) -> set[str]:
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         cur = await db.execute(
-            "SELECT task FROM used_tasks WHERE user_id=? AND group_idx=?",
+            "SELECT task FROM used_tasks WHERE user_id=? AND group_id=?",
             (user_id, group_idx)
         )
         rows = await cur.fetchall()
@@ -434,7 +516,7 @@ async def get_used_tasks(db_path: str, user_id: int, group_idx: int) -> set[str]
 
 
 async def mark_task_used(db_path: str, user_id: int, group_idx: int, task: str):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute(
             "INSERT OR IGNORE INTO used_tasks(user_id, group_id, task) VALUES(?,?,?)",
             (user_id, group_idx, task)
@@ -442,11 +524,10 @@ async def mark_task_used(db_path: str, user_id: int, group_idx: int, task: str):
         await db.commit()
 
 
-
 async def reset_used_tasks_for_group(db_path: str, group_idx: int):
-    async with aiosqlite.connect(db_path) as db:
+    async with dbtrace.connect(db_path) as db:
         await db.execute(
-            "DELETE FROM used_tasks WHERE group_idx=?",
+            "DELETE FROM used_tasks WHERE group_id=?",
             (group_idx,)
         )
         await db.commit()
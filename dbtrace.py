@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+import aiosqlite
+
+from shardpool import pool
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_MS", "50"))
+# вызовов одной функции db за один хендлер, после которых это похоже на N+1
+N_PLUS_ONE_CALLS = 10
+
+# (функция db, sql) → [число запросов, суммарное время, сек]
+_query_stats: dict[tuple[str, str], list[float]] = {}
+_slow: deque = deque(maxlen=20)
+# хендлер → счётчик вызовов функций db за его последний запуск
+_handler_calls: dict[str, Counter] = {}
+_scope: ContextVar[Counter | None] = ContextVar("db_scope", default=None)
+
+
+# ---------------- CONNECTION ----------------
+def connect(db_path: str) -> "TracedConnection":
+    """
+    Замена aiosqlite.connect для `async with`: соединение берётся из пула
+    шардов и возвращается туда же, плюс учёт запросов.
+    """
+    fn_name = sys._getframe(1).f_code.co_name
+    calls = _scope.get()
+    if calls is not None:
+        calls[fn_name] += 1
+    return TracedConnection(db_path, fn_name)
+
+
+class _Query:
+    __slots__ = ("fn", "sql", "params", "elapsed", "explained")
+
+    def __init__(self, fn: str, sql: str, params):
+        self.fn = fn
+        self.sql = " ".join(sql.split())
+        self.params = params
+        self.elapsed = 0.0
+        self.explained = False
+
+
+class TracedConnection:
+    def __init__(self, db_path: str, fn_name: str):
+        self._path = db_path
+        self._conn: aiosqlite.Connection | None = None
+        self._fn = fn_name
+        self._cursors: list[aiosqlite.Cursor] = []
+
+    async def __aenter__(self):
+        self._conn = await pool.acquire(self._path)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # недочитанный SELECT держит блокировку чтения — закрываем курсоры
+        for cur in self._cursors:
+            await cur.close()
+        self._cursors.clear()
+        # после ошибки соединение не переиспользуем
+        await pool.release(self._path, self._conn, broken=exc_type is not None)
+        self._conn = None
+
+    @property
+    def row_factory(self):
+        return self._conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._conn.row_factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def execute(self, sql: str, params=()):
+        q = self._start(sql, params)
+        t0 = time.perf_counter()
+        cur = await self._conn.execute(sql, params)
+        self._cursors.append(cur)
+        await self._account(q, time.perf_counter() - t0)
+        return TracedCursor(cur, self, q)
+
+    async def executemany(self, sql: str, seq):
+        seq = list(seq)
+        q = self._start(sql, seq[0] if seq else ())
+        t0 = time.perf_counter()
+        cur = await self._conn.executemany(sql, seq)
+        self._cursors.append(cur)
+        await self._account(q, time.perf_counter() - t0)
+        return cur
+
+    def _start(self, sql: str, params) -> _Query:
+        q = _Query(self._fn, sql, params)
+        _query_stats.setdefault((q.fn, q.sql), [0, 0.0])[0] += 1
+        return q
+
+    async def _account(self, q: _Query, dt: float):
+        q.elapsed += dt
+        _query_stats[(q.fn, q.sql)][1] += dt
+
+        if q.elapsed * 1000 >= SLOW_QUERY_MS and not q.explained:
+            q.explained = True
+            await self._explain(q)
+
+    async def _explain(self, q: _Query):
+        if not q.sql.upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            return
+
+        # план читаем сырыми кортежами, без фабрики моделей
+        factory = self._conn.row_factory
+        self._conn.row_factory = None
+        try:
+            cur = await self._conn.execute("EXPLAIN QUERY PLAN " + q.sql, q.params)
+            plan = [row[-1] for row in await cur.fetchall()]
+        except Exception as e:
+            plan = [f"explain failed: {e}"]
+        finally:
+            self._conn.row_factory = factory
+        _slow.append((q.fn, q.sql, q.elapsed * 1000, plan))
+
+
+class TracedCursor:
+    """Время fetch* добавляется к запросу, который курсор выполнил."""
+
+    def __init__(self, cur: aiosqlite.Cursor, conn: TracedConnection, q: _Query):
+        self._cur = cur
+        self._conn = conn
+        self._q = q
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    async def _timed(self, coro):
+        t0 = time.perf_counter()
+        res = await coro
+        await self._conn._account(self._q, time.perf_counter() - t0)
+        return res
+
+    async def fetchone(self):
+        return await self._timed(self._cur.fetchone())
+
+    async def fetchall(self):
+        return await self._timed(self._cur.fetchall())
+
+    async def fetchmany(self, size: int):
+        return await self._timed(self._cur.fetchmany(size))
+
+
+# ---------------- HANDLER SCOPE ----------------
+async def trace_handler_middleware(handler, event, data):
+    """Inner-middleware aiogram: считает вызовы функций db за один хендлер."""
+    calls = Counter()
+    token = _scope.set(calls)
+    try:
+        return await handler(event, data)
+    finally:
+        _scope.reset(token)
+        h = data.get("handler")
+        name = h.callback.__name__ if h else type(event).__name__
+        _handler_calls[name] = calls
+
+
+# ---------------- REPORT ----------------
+def report(top: int = 10) -> str:
+    lines = ["🐢 Запросы к базе", "", "Топ по суммарному времени:"]
+    by_time = sorted(_query_stats.items(), key=lambda kv: kv[1][1], reverse=True)
+    for (fn, sql), (n, total) in by_time[:top]:
+        lines.append(f"• {fn}: {int(n)}× {total * 1000:.0f}ms (ср. {total * 1000 / max(n, 1):.1f}ms)")
+
+    lines += ["", f"Медленные (≥ {SLOW_QUERY_MS:.0f}ms):"]
+    if not _slow:
+        lines.append("• нет")
+    for fn, sql, ms, plan in list(_slow)[-5:]:
+        lines.append(f"• {fn} {ms:.0f}ms: {sql[:120]}")
+        lines += [f"    ↳ {p}" for p in plan]
+
+    lines += ["", f"Подозрение на N+1 (≥ {N_PLUS_ONE_CALLS} вызовов за хендлер):"]
+    suspects = [
+        (handler, fn, n)
+        for handler, calls in _handler_calls.items()
+        for fn, n in calls.items()
+        if n >= N_PLUS_ONE_CALLS
+    ]
+    if not suspects:
+        lines.append("• нет")
+    for handler, fn, n in sorted(suspects, key=lambda x: -x[2]):
+        lines.append(f"• {handler} → {fn}: {n}×")
+
+    idle = pool.stats()
+    lines += ["", f"Пул соединений: {sum(idle.values())} простаивающих на {len(idle)} шардах"]
+
+    return "\n".join(lines)
+
+
+def reset():
+    _query_stats.clear()
+    _slow.clear()
+    _handler_calls.clear()
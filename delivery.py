@@ -0,0 +1,54 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import Message
+
+from db import set_undeliverable, get_user_label
+
+
+# ---------------- SAFE SEND ----------------
+RETRY_ATTEMPTS = 3
+
+
+async def _with_retry(call):
+    # flood control: Telegram сам говорит, сколько ждать
+    for _ in range(RETRY_ATTEMPTS - 1):
+        try:
+            return await call()
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+    return await call()
+
+
+async def send_or_mark(bot: Bot, db_path: str, tg_id: int, text: str, **kwargs) -> bool:
+    """
+    Отправка в личку игроку.
+    Если бот заблокирован (403), игрок помечается недоставляемым
+    и больше не попадает в рассылки и случайный выбор.
+    На flood control (429) ждёт и повторяет; прочие ошибки
+    Telegram пробрасывает вызывающему.
+    """
+    try:
+        await _with_retry(lambda: bot.send_message(tg_id, text, **kwargs))
+        return True
+    except TelegramForbiddenError:
+        await set_undeliverable(db_path, tg_id)
+        return False
+
+
+async def copy_or_mark(bot: Bot, db_path: str, tg_id: int, message: Message, **kwargs) -> bool:
+    # копия без шапки «переслано от» — отправитель остаётся анонимным
+    try:
+        await _with_retry(lambda: bot.copy_message(tg_id, message.chat.id, message.message_id, **kwargs))
+        return True
+    except TelegramForbiddenError:
+        await set_undeliverable(db_path, tg_id)
+        return False
+
+
+async def undeliverable_summary(db_path: str, ids: list[int]) -> str:
+    lines = ["🚫 Не доставлено (бот заблокирован), игроки выключены из рассылок:"]
+    for tg_id in ids:
+        lines.append(f"• {await get_user_label(db_path, tg_id)}")
+    return "\n".join(lines)
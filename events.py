@@ -0,0 +1,276 @@
+import os
+import random
+import shutil
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import aiosqlite
+from aiogram.types import CallbackQuery
+
+from db import init_db, load_tasks_if_empty
+from seasons import init_seasons, get_active_season_path
+from treasure import AnswerMatcher
+
+DEFAULT_EVENT = "default"
+
+
+# ---------------- MODEL ----------------
+@dataclass(slots=True)
+class Event:
+    code: str
+    organizer_id: int
+    db_path: str
+    seasons_db: str
+    seasons_dir: str
+    backup_dir: str
+    tasks_file: str
+    emotions_file: str
+    treasure_file: str
+    # ответы активной загадки «Золотоискателя» (None — события нет)
+    treasure: AnswerMatcher | None = None
+    # все случайные решения игры: с заданным сидом игра воспроизводима
+    rng: random.Random = field(default_factory=random.Random, repr=False)
+
+
+_current: ContextVar[Event] = ContextVar("current_event")
+
+
+def current_event() -> Event:
+    return _current.get()
+
+
+def use_event(event: Event):
+    return _current.set(event)
+
+
+async def prepare_event(event: Event, legacy_db_path: str):
+    """Активный сезон, схема и стартовые задания события."""
+    event.db_path = await init_seasons(event.seasons_db, legacy_db_path)
+    await init_db(event.db_path)
+    await load_tasks_if_empty(event.db_path, event.tasks_file)
+
+
+# ---------------- REGISTRY ----------------
+async def init_events(registry_path: str):
+    async with aiosqlite.connect(registry_path) as db:
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS events(
+            code TEXT PRIMARY KEY,
+            organizer_id INTEGER NOT NULL,
+            root_dir TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )""")
+
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS event_chats(
+            chat_id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL
+        )""")
+
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS event_members(
+            tg_id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL
+        )""")
+        await db.commit()
+
+
+async def create_event(registry_path: str, code: str, organizer_id: int, root_dir: str) -> bool:
+    async with aiosqlite.connect(registry_path) as db:
+        cur = await db.execute("""
+        INSERT OR IGNORE INTO events(code, organizer_id, root_dir, created_at)
+        VALUES(?, ?, ?, ?)
+        """, (code, organizer_id, root_dir, datetime.utcnow().isoformat()))
+        await db.commit()
+        return cur.rowcount > 0
+
+
+async def get_event_row(registry_path: str, code: str):
+    async with aiosqlite.connect(registry_path) as db:
+        cur = await db.execute(
+            "SELECT organizer_id, root_dir FROM events WHERE code=?",
+            (code,)
+        )
+        return await cur.fetchone()
+
+
+async def list_events(registry_path: str):
+    async with aiosqlite.connect(registry_path) as db:
+        cur = await db.execute("SELECT code, organizer_id, root_dir FROM events ORDER BY created_at")
+        return await cur.fetchall()
+
+
+async def bind_chat(registry_path: str, chat_id: int, code: str):
+    async with aiosqlite.connect(registry_path) as db:
+        await db.execute("""
+        INSERT INTO event_chats(chat_id, code) VALUES(?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET code=excluded.code
+        """, (chat_id, code))
+        await db.commit()
+
+
+async def join_event(registry_path: str, tg_id: int, code: str):
+    async with aiosqlite.connect(registry_path) as db:
+        await db.execute("""
+        INSERT INTO event_members(tg_id, code) VALUES(?, ?)
+        ON CONFLICT(tg_id) DO UPDATE SET code=excluded.code
+        """, (tg_id, code))
+        await db.commit()
+
+
+async def find_event_code(registry_path: str, chat_id: int, tg_id: int) -> str | None:
+    async with aiosqlite.connect(registry_path) as db:
+        cur = await db.execute("SELECT code FROM event_chats WHERE chat_id=?", (chat_id,))
+        row = await cur.fetchone()
+        if row:
+            return row[0]
+        cur = await db.execute("SELECT code FROM event_members WHERE tg_id=?", (tg_id,))
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+# ---------------- ROUTER ----------------
+class EventRouter:
+    """
+    Раскладывает апдейты по событиям: группа — по привязке чата,
+    личка — по коду, с которым игрок зашёл (/start CODE).
+    Всё непривязанное уходит в событие по умолчанию из .env.
+    Событие поднимается с диска при первом обращении.
+    """
+
+    def __init__(self, registry_path: str, events_dir: str, default: Event):
+        self.registry_path = registry_path
+        self.events_dir = events_dir
+        self.default = default
+        self._events: dict[str, Event] = {DEFAULT_EVENT: default}
+        # chat_id/tg_id → код события; None — событие по умолчанию.
+        # Привязку мог сменить другой воркер — кэш сбрасывает forget_routes()
+        self._routes: dict[tuple[int, int], str | None] = {}
+
+    def loaded(self) -> list[Event]:
+        return list(self._events.values())
+
+    @staticmethod
+    def _build(code: str, organizer_id: int, root_dir: str) -> Event:
+        return Event(
+            code=code,
+            organizer_id=organizer_id,
+            db_path="",
+            seasons_db=os.path.join(root_dir, "seasons.db"),
+            seasons_dir=os.path.join(root_dir, "seasons"),
+            backup_dir=os.path.join(root_dir, "backups"),
+            tasks_file=os.path.join(root_dir, "tasks.txt"),
+            emotions_file=os.path.join(root_dir, "wave_emotions.txt"),
+            treasure_file=os.path.join(root_dir, "treasure.txt"),
+        )
+
+    async def get(self, code: str) -> Event | None:
+        event = self._events.get(code)
+        if event:
+            return event
+
+        row = await get_event_row(self.registry_path, code)
+        if not row:
+            return None
+
+        organizer_id, root_dir = row
+        event = self._build(code, organizer_id, root_dir)
+        await prepare_event(event, os.path.join(root_dir, "bot.db"))
+
+        self._events[code] = event
+        return event
+
+    async def refresh_seasons(self, codes: set[str]) -> list[Event]:
+        """
+        Сезон мог смениться на другом воркере: перечитываем активный файл
+        из seasons.db у поднятых событий с кодами codes (о смене узнаём
+        по счётчику в общем файле лидера). Возвращает события, где он поменялся.
+        """
+        moved = []
+        for code in codes:
+            event = self._events.get(code)
+            if not event:
+                continue
+            db_path = await get_active_season_path(event.seasons_db)
+            if db_path and db_path != event.db_path:
+                event.db_path = db_path
+                moved.append(event)
+        return moved
+
+    async def known_events(self) -> list[Event]:
+        """
+        Все события для планировщика и бэкапов, без подъёма спящих:
+        у спящего только читаем активный сезон из его seasons.db.
+        Событие, которое ни разу не открывали, пропускаем — у него нет базы.
+        """
+        events = self.loaded()
+        for code, organizer_id, root_dir in await list_events(self.registry_path):
+            if code in self._events:
+                continue
+            event = self._build(code, organizer_id, root_dir)
+            if not os.path.exists(event.seasons_db):
+                continue
+            db_path = await get_active_season_path(event.seasons_db)
+            if db_path:
+                event.db_path = db_path
+                events.append(event)
+        return events
+
+    async def create(self, code: str, organizer_id: int) -> Event | None:
+        if code == DEFAULT_EVENT:
+            return None
+        root_dir = os.path.join(self.events_dir, code)
+        os.makedirs(root_dir, exist_ok=True)
+        # стартовые файлы заданий — копия файлов события по умолчанию
+        for src, name in (
+            (self.default.tasks_file, "tasks.txt"),
+            (self.default.emotions_file, "wave_emotions.txt"),
+            (self.default.treasure_file, "treasure.txt"),
+        ):
+            dst = os.path.join(root_dir, name)
+            if os.path.exists(src) and not os.path.exists(dst):
+                shutil.copy(src, dst)
+
+        if not await create_event(self.registry_path, code, organizer_id, root_dir):
+            return None
+        return await self.get(code)
+
+    async def bind_chat(self, chat_id: int, event: Event):
+        await bind_chat(self.registry_path, chat_id, event.code)
+        self._routes[(chat_id, 0)] = event.code
+
+    async def join(self, tg_id: int, event: Event):
+        await join_event(self.registry_path, tg_id, event.code)
+        self._routes[(0, tg_id)] = event.code
+
+    def forget_routes(self):
+        self._routes.clear()
+
+    async def resolve(self, chat_id: int, chat_type: str, tg_id: int) -> Event:
+        key = (chat_id, 0) if chat_type != "private" else (0, tg_id)
+        if key not in self._routes:
+            self._routes[key] = await find_event_code(
+                self.registry_path,
+                chat_id if chat_type != "private" else 0,
+                tg_id if chat_type == "private" else 0,
+            )
+        code = self._routes[key]
+        return (await self.get(code) if code else None) or self.default
+
+    async def middleware(self, handler, event, data):
+        """Outer-middleware aiogram: выставляет событие для хендлеров и фильтров."""
+        message = event.message if isinstance(event, CallbackQuery) else event
+        chat = message.chat if message else None
+        user = event.from_user
+
+        current = await self.resolve(
+            chat.id if chat else 0,
+            chat.type if chat else "private",
+            user.id if user else 0,
+        )
+        token = use_event(current)
+        try:
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
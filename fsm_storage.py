@@ -0,0 +1,168 @@
+import asyncio
+import json
+import time
+from typing import Any
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.destiny}"
+
+
+def _state_name(state: StateType) -> str | None:
+    return state.state if isinstance(state, State) else state
+
+
+# ---------------- MEMORY ----------------
+class TTLMemoryStorage(BaseStorage):
+    """Состояния в памяти процесса; запись живёт ttl секунд с последнего изменения."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: dict[str, tuple[str | None, dict[str, Any], float]] = {}
+
+    def _get(self, key: StorageKey):
+        k = _key(key)
+        item = self._items.get(k)
+        if item and item[2] < time.monotonic():
+            del self._items[k]
+            return None
+        return item
+
+    def _put(self, key: StorageKey, state: str | None, data: dict[str, Any]):
+        k = _key(key)
+        if state is None and not data:
+            self._items.pop(k, None)
+        else:
+            self._items[k] = (state, data, time.monotonic() + self.ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        item = self._get(key)
+        self._put(key, _state_name(state), item[1] if item else {})
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        item = self._get(key)
+        return item[0] if item else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        item = self._get(key)
+        self._put(key, item[0] if item else None, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        item = self._get(key)
+        return dict(item[1]) if item else {}
+
+    async def sweep(self) -> None:
+        now = time.monotonic()
+        for k in [k for k, item in self._items.items() if item[2] < now]:
+            del self._items[k]
+
+    async def close(self) -> None:
+        self._items.clear()
+
+
+# ---------------- SQLITE ----------------
+class SQLiteStorage(BaseStorage):
+    """
+    Состояния в отдельном файле SQLite: переживают рестарт
+    и видны всем процессам бота. Состояния всегда читаются из базы:
+    другой воркер мог их сменить или сбросить. В памяти процесса
+    на miss_ttl секунд запоминается только отсутствие записи
+    для ключей групповых чатов — состояния ставятся лишь в личке,
+    так что обычные сообщения в группе базу не трогают.
+    Просроченные строки удаляет sweep().
+    """
+
+    def __init__(self, db_path: str, ttl: float, miss_ttl: float = 30):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._db: aiosqlite.Connection | None = None
+        # ключ группового чата -> до какого момента считать, что записи нет
+        self._misses: dict[str, float] = {}
+
+    async def _conn(self) -> aiosqlite.Connection:
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.db_path)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm(
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )""")
+            await self._db.commit()
+        return self._db
+
+    async def _get(self, key: StorageKey):
+        k = _key(key)
+        now = time.monotonic()
+        if self._misses.get(k, 0) > now:
+            return None
+        db = await self._conn()
+        cur = await db.execute(
+            "SELECT state, data, expires_at FROM fsm WHERE key=?",
+            (k,)
+        )
+        row = await cur.fetchone()
+        if row and row[2] >= time.time():
+            return row[0], json.loads(row[1])
+        if key.chat_id != key.user_id:
+            self._misses[k] = now + self.miss_ttl
+        return None
+
+    async def _put(self, key: StorageKey, state: str | None, data: dict[str, Any]):
+        db = await self._conn()
+        k = _key(key)
+        if state is None and not data:
+            await db.execute("DELETE FROM fsm WHERE key=?", (k,))
+        else:
+            self._misses.pop(k, None)
+            await db.execute("""
+            INSERT INTO fsm(key, state, data, expires_at) VALUES(?,?,?,?)
+            ON CONFLICT(key) DO UPDATE SET
+                state=excluded.state,
+                data=excluded.data,
+                expires_at=excluded.expires_at
+            """, (k, state, json.dumps(data, ensure_ascii=False), time.time() + self.ttl))
+        await db.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        item = await self._get(key)
+        await self._put(key, _state_name(state), item[1] if item else {})
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        item = await self._get(key)
+        return item[0] if item else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        item = await self._get(key)
+        await self._put(key, item[0] if item else None, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        item = await self._get(key)
+        return item[1] if item else {}
+
+    async def sweep(self) -> None:
+        db = await self._conn()
+        await db.execute("DELETE FROM fsm WHERE expires_at<?", (time.time(),))
+        await db.commit()
+        now = time.monotonic()
+        for k in [k for k, until in self._misses.items() if until <= now]:
+            del self._misses[k]
+
+    async def close(self) -> None:
+        self._misses.clear()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+async def run_sweeper(storage: TTLMemoryStorage | SQLiteStorage, every: float = 60):
+    while True:
+        await asyncio.sleep(every)
+        await storage.sweep()
@@ -0,0 +1,176 @@
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from db import (
+    count_active_users,
+    iter_active_users,
+    filter_active_ids,
+    clear_pairs,
+    set_pair,
+    get_user_label,
+    init_wave_queue,
+    clear_wave_assignments,
+    insert_wave_assignment,
+    get_used_tasks,
+    reset_used_tasks_for_group,
+    mark_task_used,
+)
+from repository import get_wave_state, get_wave_groups
+from delivery import send_or_mark, undeliverable_summary
+from logic import build_secret_santa_pairs, split_into_groups_max5, make_wave_mapping
+from treasure import parse_treasure_line
+from events import Event
+from profiling import profiled
+
+# Игровой движок без хендлеров: всё, что зависит от случая, берёт event.rng,
+# поэтому с одинаковым сидом игра проигрывается одинаково (см. replay.py).
+
+
+def read_lines(path: str) -> list[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [x.strip() for x in f if x.strip()]
+
+
+# ---------------- WAVES ----------------
+async def pick_task_for_user(event: Event, user_id: int, group_idx: int, tasks: list[str]) -> str:
+    used = await get_used_tasks(event.db_path, user_id, group_idx)
+    available = [t for t in tasks if t not in used]
+
+    if not available:
+        await reset_used_tasks_for_group(event.db_path, group_idx)
+        available = tasks
+
+    task = event.rng.choice(available)
+    await mark_task_used(event.db_path, user_id, group_idx, task)
+    return task
+
+
+@profiled("run_wave")
+async def run_wave(bot: Bot, event: Event, developer_id: int):
+    db_path = event.db_path
+    if await count_active_users(db_path) < 4:
+        return "⛔ Мало игроков"
+
+    state = await get_wave_state(db_path)
+
+    if not state.is_initialized:
+        ids = [u.tg_id async for batch in iter_active_users(db_path) for u in batch]
+        event.rng.shuffle(ids)
+        await init_wave_queue(db_path, split_into_groups_max5(ids))
+        state = await get_wave_state(db_path)
+
+    wave_index, active_idx = state.wave_index, state.active_group_idx
+
+    groups = await get_wave_groups(db_path)
+    # заблокировавшие бота уже не активны — в волне их не трогаем
+    active_ids = await filter_active_ids(
+        db_path, groups[active_idx] + groups[(active_idx + 1) % len(groups)]
+    )
+    active = [x for x in groups[active_idx] if x in active_ids]
+    passive = [x for x in groups[(active_idx + 1) % len(groups)] if x in active_ids]
+
+    tasks = read_lines(event.emotions_file)
+    pairs = make_wave_mapping(active, passive, event.rng) if passive else []
+
+    log = [f"🌊 Волна {wave_index} запущена"]
+    blocked = []
+    failed = []
+    # повторный запуск той же волны переписывает её задания
+    await clear_wave_assignments(db_path, wave_index)
+
+    for a_id, t_id in pairs:
+        task = await pick_task_for_user(event, a_id, active_idx, tasks)
+
+        try:
+            delivered = await send_or_mark(
+                bot,
+                db_path,
+                a_id,
+                f"🎯 *Твоя цель (если в задании это предусмотрено)*: {await get_user_label(db_path, t_id)}\n\n"
+                f"*Задание:*\n{task}"
+            )
+        except TelegramAPIError as e:
+            failed.append(f"• {await get_user_label(db_path, a_id)}: {e}")
+            continue
+        if not delivered:
+            blocked.append(a_id)
+            continue
+        await insert_wave_assignment(db_path, wave_index, a_id, t_id, task)
+
+        log.append(
+            f"{await get_user_label(db_path, a_id)} → "
+            f"{await get_user_label(db_path, t_id)} | {task}"
+        )
+
+    if failed:
+        log += ["", "⚠️ Не смог отправить:"] + failed
+
+    # сообщение разработчику
+    await bot.send_message(
+        developer_id,
+        "🚀 " + "\n".join(log)
+    )
+
+    if blocked:
+        await bot.send_message(event.organizer_id, await undeliverable_summary(db_path, blocked))
+
+    return f"✅ Волна {wave_index} запущена"
+
+
+# ---------------- SANTA ----------------
+@profiled("run_santa")
+async def run_santa(bot: Bot, event: Event):
+    db_path = event.db_path
+    ids = [u.tg_id async for batch in iter_active_users(db_path) for u in batch]
+    if len(ids) < 2:
+        return "⛔ Нужно минимум 2 игрока."
+
+    pairs = build_secret_santa_pairs(ids, event.rng)
+
+    await clear_pairs(db_path)
+    for s, c in pairs.items():
+        await set_pair(db_path, s, c)
+
+    # лички: сбой одного получателя не обрывает рассылку остальным
+    blocked = []
+    failed = []
+    for s, c in pairs.items():
+        try:
+            delivered = await send_or_mark(
+                bot,
+                db_path,
+                s,
+                f"🎅 Твой подопечный:\n{await get_user_label(db_path, c)}"
+            )
+        except TelegramAPIError as e:
+            failed.append(f"• {await get_user_label(db_path, s)}: {e}")
+            continue
+        if not delivered:
+            blocked.append(s)
+
+    # организатор
+    log = ["🎅 Санта запущен:"]
+    for s, c in pairs.items():
+        log.append(
+            f"{await get_user_label(db_path, s)} → {await get_user_label(db_path, c)}"
+        )
+    if failed:
+        log += ["", "⚠️ Не смог отправить:"] + failed
+
+    await bot.send_message(event.organizer_id, "\n".join(log))
+    if blocked:
+        await bot.send_message(event.organizer_id, await undeliverable_summary(db_path, blocked))
+    return "✅ Санта запущен."
+
+
+# ---------------- TREASURE ----------------
+def draw_riddle(event: Event) -> tuple[str, list[str]] | None:
+    # None — файл загадок пуст
+    riddles = read_lines(event.treasure_file)
+    if not riddles:
+        return None
+    return parse_treasure_line(event.rng.choice(riddles))
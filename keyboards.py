@@ -1,8 +1,10 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-def user_menu(is_developer: bool):
+def _build_user_menu(is_developer: bool):
     kb = InlineKeyboardBuilder()
     kb.button(text="🎅 Санта", callback_data="santa_me")
+    kb.button(text="✉️ Подопечному", callback_data="relay_to_child")
+    kb.button(text="✉️ Санте", callback_data="relay_to_santa")
     kb.button(text="❌ Удалиться", callback_data="delete_me")
     if is_developer:
         kb.button(text="🧠 Запустить Санту", callback_data="dev_santa_start")
@@ -16,7 +18,28 @@ def user_menu(is_developer: bool):
         kb.button(text="👥 Список игроков", callback_data="dev_users")
         kb.button(text="📊 Статус игры", callback_data="dev_status")
         kb.button(text="🧹 Полный сброс (DEV)", callback_data="dev_full_reset")
+        kb.button(text="📚 Архив сезонов", callback_data="dev_seasons")
+        kb.button(text="💾 Бэкап базы", callback_data="dev_backup")
+        kb.button(text="🔬 Профилирование", callback_data="dev_profile")
+        kb.button(text="🐢 Запросы к базе", callback_data="dev_db_trace")
         kb.button(text="🔄 Перезагрузить задания", callback_data="dev_reload_tasks")
         kb.button(text="💬 Написать в группу", callback_data="dev_say_group")
     kb.adjust(2)
     return kb.as_markup()
+
+
+# меню статичное — собираем оба варианта один раз при импорте
+_USER_MENUS = {flag: _build_user_menu(flag) for flag in (False, True)}
+
+
+def user_menu(is_developer: bool):
+    return _USER_MENUS[bool(is_developer)]
+
+
+def relay_reply_kb(direction: str):
+    kb = InlineKeyboardBuilder()
+    if direction == "to_santa":
+        kb.button(text="↩️ Ответить Санте", callback_data="relay_to_santa")
+    else:
+        kb.button(text="↩️ Ответить подопечному", callback_data="relay_to_child")
+    return kb.as_markup()
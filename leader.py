@@ -0,0 +1,169 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+log = logging.getLogger(__name__)
+
+
+# ---------------- LEASE ----------------
+# Лидер — владелец строки-аренды в общем файле SQLite.
+# Лидер продлевает аренду каждые heartbeat_sec; если он умер,
+# аренда истекает через lease_sec и её забирает другой воркер.
+async def init_leader_db(db_path: str):
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS leader_lease(
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""")
+
+        # счётчики изменений: воркер пишет, лидер замечает на heartbeat
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS versions(
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )""")
+        await db.commit()
+
+
+async def try_acquire_lease(db_path: str, name: str, owner: str, lease_sec: float) -> bool:
+    now = time.time()
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("""
+        INSERT INTO leader_lease(name, owner, expires_at) VALUES(?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner=excluded.owner,
+            expires_at=excluded.expires_at
+        WHERE leader_lease.owner=excluded.owner OR leader_lease.expires_at<?
+        """, (name, owner, now + lease_sec, now))
+        await db.commit()
+
+        cur = await db.execute("SELECT owner FROM leader_lease WHERE name=?", (name,))
+        row = await cur.fetchone()
+        return bool(row) and row[0] == owner
+
+
+async def release_lease(db_path: str, name: str, owner: str):
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute(
+            "DELETE FROM leader_lease WHERE name=? AND owner=?",
+            (name, owner)
+        )
+        await db.commit()
+
+
+# ---------------- VERSIONS ----------------
+async def bump_version(db_path: str, key: str):
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("""
+        INSERT INTO versions(key, value) VALUES(?, 1)
+        ON CONFLICT(key) DO UPDATE SET value=value+1
+        """, (key,))
+        await db.commit()
+
+
+async def get_versions(db_path: str) -> dict[str, int]:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute("SELECT key, value FROM versions")
+        return dict(await cur.fetchall())
+
+
+# ---------------- ELECTION ----------------
+class LeaderElection:
+    def __init__(
+        self,
+        db_path: str,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+        on_heartbeat: Callable[[], Awaitable[None]] | None = None,
+        name: str = "scheduler",
+        lease_sec: float = 6,
+        heartbeat_sec: float = 2,
+    ):
+        self.db_path = db_path
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_sec = lease_sec
+        self.heartbeat_sec = heartbeat_sec
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        # вызывается на каждом такте у всех воркеров (лидер ли — см. is_leader)
+        self.on_heartbeat = on_heartbeat
+        self.is_leader = False
+        # колбэки отработали избрание (задания поставлены)
+        self._elected = False
+        self._beat = asyncio.Event()
+        self._follower: asyncio.Task | None = None
+
+    async def run(self):
+        """
+        Аренду продлевает только этот цикл; колбэки идут отдельной задачей
+        (_follow) и сколько бы ни длились, продление не задерживают —
+        иначе аренда истечёт у живого лидера и задания выполнятся дважды.
+        """
+        await init_leader_db(self.db_path)
+        self._follower = asyncio.create_task(self._follow())
+        try:
+            while True:
+                try:
+                    acquired = await try_acquire_lease(
+                        self.db_path, self.name, self.owner, self.lease_sec
+                    )
+                except Exception:
+                    # база недоступна — продлить аренду не можем, считаем себя не лидером
+                    acquired = False
+
+                if not acquired and self.is_leader:
+                    await self._demote()
+                self.is_leader = acquired
+                self._beat.set()
+
+                await asyncio.sleep(self.heartbeat_sec)
+        finally:
+            self._follower.cancel()
+            await asyncio.gather(self._follower, return_exceptions=True)
+            if self.is_leader:
+                self.is_leader = False
+                await self.on_demoted()
+                await release_lease(self.db_path, self.name, self.owner)
+
+    async def _demote(self):
+        # аренду потеряли: незаконченное избрание или heartbeat обрываем,
+        # задания снимаем сразу, не дожидаясь колбэков
+        self.is_leader = False
+        self._follower.cancel()
+        await asyncio.gather(self._follower, return_exceptions=True)
+        self._elected = False
+        try:
+            await self.on_demoted()
+        except Exception:
+            log.exception("on_demoted failed")
+        self._follower = asyncio.create_task(self._follow())
+
+    async def _follow(self):
+        # такты, пришедшие пока колбэк занят, схлопываются в один
+        # ошибка колбэка не должна убивать цикл: без него
+        # задания молча перестанут ставиться навсегда
+        while True:
+            await self._beat.wait()
+            self._beat.clear()
+            if self.is_leader and not self._elected:
+                try:
+                    await self.on_elected()
+                    self._elected = True
+                except Exception:
+                    # аренду держим, но задания не поставлены — повторим на следующем такте
+                    log.exception("on_elected failed")
+            elif self.on_heartbeat:
+                try:
+                    await self.on_heartbeat()
+                except Exception:
+                    log.exception("on_heartbeat failed")
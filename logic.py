@@ -2,17 +2,19 @@ import random
 from typing import List, Tuple
 
 
-def build_secret_santa_pairs(user_ids: List[int]) -> dict[int, int]:
+def build_secret_santa_pairs(user_ids: List[int], rng: random.Random | None = None) -> dict[int, int]:
     """
     Классический тайный санта:
     каждый участник получает ровно одного подопечного,
     сам себе назначен быть не может.
+
+    rng — источник случайности (по умолчанию общий модуль random).
     """
     if len(user_ids) < 2:
         raise ValueError("Нужно минимум 2 участника")
 
     shuffled = user_ids[:]
-    random.shuffle(shuffled)
+    (rng or random).shuffle(shuffled)
 
     return {
         shuffled[i]: shuffled[(i + 1) % len(shuffled)]
@@ -61,7 +63,11 @@ def split_into_groups_max5(user_ids: List[int]) -> List[List[int]]:
     return groups
 
 
-def make_wave_mapping(active: List[int], passive: List[int]) -> List[Tuple[int, int]]:
+def make_wave_mapping(
+    active: List[int],
+    passive: List[int],
+    rng: random.Random | None = None,
+) -> List[Tuple[int, int]]:
     """
     Назначение целей в волне.
 
@@ -75,11 +81,12 @@ def make_wave_mapping(active: List[int], passive: List[int]) -> List[Tuple[int,
     Запрещено:
     - один ACTIVE → две цели (1к2)
     """
+    rng = rng or random
     a = active[:]
     p = passive[:]
 
-    random.shuffle(a)
-    random.shuffle(p)
+    rng.shuffle(a)
+    rng.shuffle(p)
 
     pairs: List[Tuple[int, int]] = []
 
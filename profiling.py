@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import cProfile
+import functools
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable
+
+SAMPLE_INTERVAL = 0.005
+
+
+class _Session:
+    def __init__(self, remaining: int):
+        self.remaining = remaining
+        self.profile = cProfile.Profile()
+        self.stacks: Counter[str] = Counter()
+        self.wall: list[float] = []
+
+
+# имя хендлера → активная сессия; пустой dict = профилирование выключено
+_sessions: dict[str, _Session] = {}
+_on_done: Callable[[str, list[str]], Awaitable[None]] | None = None
+_out_dir = "profiles"
+# cProfile одновременно может быть включён только один
+_cprofile_busy = False
+
+
+# ---------------- CONTROL ----------------
+def arm(
+    names: list[str],
+    count: int,
+    out_dir: str,
+    on_done: Callable[[str, list[str]], Awaitable[None]],
+):
+    """Профилировать следующие count вызовов каждого из хендлеров names."""
+    global _on_done, _out_dir
+    _on_done = on_done
+    _out_dir = out_dir
+    for name in names:
+        _sessions[name] = _Session(count)
+
+
+def disarm():
+    _sessions.clear()
+
+
+def armed() -> dict[str, int]:
+    return {name: s.remaining for name, s in _sessions.items()}
+
+
+# ---------------- SAMPLING ----------------
+def _coro_stack(coro) -> list[str]:
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+async def _sample(task: asyncio.Task, stacks: Counter):
+    # пока хендлер ждёт (сеть, база), смотрим, на чём именно он висит
+    while not task.done():
+        frames = _coro_stack(task.get_coro())
+        if frames:
+            stacks[";".join(frames)] += 1
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+
+# ---------------- DECORATOR ----------------
+def profiled(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            # выключено — одна проверка dict
+            if name not in _sessions:
+                return await fn(*args, **kwargs)
+            return await _run_profiled(name, fn, args, kwargs)
+        return wrapper
+    return decorator
+
+
+async def _run_profiled(name: str, fn, args, kwargs):
+    global _cprofile_busy
+    session = _sessions[name]
+    sampler = asyncio.create_task(_sample(asyncio.current_task(), session.stacks))
+
+    use_cprofile = not _cprofile_busy
+    if use_cprofile:
+        _cprofile_busy = True
+        session.profile.enable()
+
+    t0 = time.perf_counter()
+    try:
+        return await fn(*args, **kwargs)
+    finally:
+        session.wall.append(time.perf_counter() - t0)
+        if use_cprofile:
+            session.profile.disable()
+            _cprofile_busy = False
+        sampler.cancel()
+
+        session.remaining -= 1
+        if session.remaining <= 0 and _sessions.get(name) is session:
+            del _sessions[name]
+            await _finish(name, session)
+
+
+async def _finish(name: str, session: _Session):
+    os.makedirs(_out_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    base = os.path.join(_out_dir, f"{name}_{stamp}")
+
+    pstats_path = base + ".pstats"
+    session.profile.dump_stats(pstats_path)
+
+    # формат collapsed stacks: flamegraph.pl / speedscope читают напрямую
+    folded_path = base + ".folded"
+    with open(folded_path, "w", encoding="utf-8") as f:
+        for stack, n in session.stacks.most_common():
+            f.write(f"{stack} {n}\n")
+
+    if _on_done:
+        walls = ", ".join(f"{w * 1000:.0f}ms" for w in session.wall)
+        await _on_done(f"🔬 {name}: {len(session.wall)} вызовов ({walls})", [pstats_path, folded_path])
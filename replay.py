@@ -0,0 +1,171 @@
+"""
+Воспроизведение записанной игры на свежей базе. Запуск:
+
+    python replay.py night.jsonl                  # сид 0, один прогон
+    python replay.py night.jsonl --seed 7 --runs 3
+
+Запись включает бот: REPLAY_LOG=night.jsonl в .env — регистрации игроков
+и действия разработчика (Санта, волны, сокровище, сброс) пишутся по строке JSON.
+Сообщения вместо Telegram складываются в протокол; при одинаковом сиде
+протоколы всех прогонов должны совпасть, иначе выход с кодом 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+
+from db import upsert_user, set_inactive, advance_wave, reset_waves
+from events import Event, DEFAULT_EVENT, prepare_event
+from seasons import start_new_season
+from game import run_wave, run_santa, draw_riddle
+from shardpool import pool
+
+
+# ---------------- RECORDING ----------------
+class Recorder:
+    """Дописывает шаги игры в JSONL-файл, по строке на шаг."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, event_code: str, action: str, **fields):
+        step = {"event": event_code, "action": action, **fields}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(step, ensure_ascii=False) + "\n")
+
+
+def load_steps(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ---------------- REPLAY ----------------
+class ReplayBot:
+    """Вместо Telegram: исходящие сообщения складываются в протокол."""
+
+    def __init__(self):
+        self.transcript: list[tuple] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.transcript.append((chat_id, text))
+
+
+def make_event(code: str, root: str, seed: int) -> Event:
+    # файлы заданий — как у бота: у события свои, если есть, иначе общие
+    source = os.path.join(os.getenv("EVENTS_DIR", "events"), code)
+    if code == DEFAULT_EVENT or not os.path.isdir(source):
+        tasks_file = os.getenv("TASKS_FILE", "tasks.txt")
+        emotions_file = os.getenv("EMOTIONS_FILE", "wave_emotions.txt")
+        treasure_file = os.getenv("TREASURE_FILE", "treasure.txt")
+    else:
+        tasks_file = os.path.join(source, "tasks.txt")
+        emotions_file = os.path.join(source, "wave_emotions.txt")
+        treasure_file = os.path.join(source, "treasure.txt")
+
+    return Event(
+        code=code,
+        organizer_id=0,
+        db_path=os.path.join(root, "bot.db"),
+        seasons_db=os.path.join(root, "seasons.db"),
+        seasons_dir=os.path.join(root, "seasons"),
+        backup_dir=os.path.join(root, "backups"),
+        tasks_file=tasks_file,
+        emotions_file=emotions_file,
+        treasure_file=treasure_file,
+        # свой поток случайности на событие: шаги разных событий не влияют друг на друга
+        rng=random.Random(f"{seed}:{code}"),
+    )
+
+
+async def run_step(bot: ReplayBot, event: Event, step: dict):
+    action = step["action"]
+    if action == "register":
+        await upsert_user(event.db_path, step["user"], step.get("username"), step.get("full_name", ""))
+    elif action == "leave":
+        await set_inactive(event.db_path, step["user"])
+    elif action == "santa":
+        bot.transcript.append(("result", await run_santa(bot, event)))
+    elif action == "wave":
+        bot.transcript.append(("result", await run_wave(bot, event, 0)))
+    elif action == "wave_next":
+        await advance_wave(event.db_path)
+        bot.transcript.append(("result", await run_wave(bot, event, 0)))
+    elif action == "wave_reset":
+        await reset_waves(event.db_path)
+    elif action == "treasure":
+        drawn = draw_riddle(event)
+        bot.transcript.append(("riddle", drawn[0] if drawn else None))
+    elif action == "season":
+        event.db_path = await start_new_season(event.seasons_db, event.seasons_dir, event.tasks_file)
+    else:
+        raise ValueError(f"Неизвестный шаг: {action}")
+
+
+async def replay(steps: list[dict], seed: int) -> tuple[str, dict[str, list[float]]]:
+    """Один прогон на пустых базах. Возвращает (хэш протокола, время по шагам)."""
+    bot = ReplayBot()
+    timings: dict[str, list[float]] = {}
+    events: dict[str, Event] = {}
+    members: dict[int, str] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for step in steps:
+            code = step.get("event", DEFAULT_EVENT)
+            if code not in events:
+                root = os.path.join(tmp, code)
+                os.makedirs(root)
+                events[code] = make_event(code, root, seed)
+                await prepare_event(events[code], events[code].db_path)
+            event = events[code]
+
+            # как в боте: игрок, перешедший в другое событие, выключается в прошлом
+            if step["action"] == "register":
+                previous = members.get(step["user"])
+                if previous and previous != code:
+                    await set_inactive(events[previous].db_path, step["user"])
+                members[step["user"]] = code
+
+            t0 = time.perf_counter()
+            await run_step(bot, event, step)
+            timings.setdefault(step["action"], []).append(time.perf_counter() - t0)
+
+        # соединения с временными базами закрываем до удаления каталога
+        await pool.close_all()
+
+    digest = hashlib.sha256(
+        json.dumps(bot.transcript, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return digest, timings
+
+
+async def main(argv: list[str]) -> int:
+    from bench import report
+
+    parser = argparse.ArgumentParser(description="Воспроизведение записанной игры")
+    parser.add_argument("recording")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    steps = load_steps(args.recording)
+    digests = set()
+    for run in range(1, args.runs + 1):
+        digest, timings = await replay(steps, args.seed)
+        digests.add(digest)
+        print(f"--- прогон {run}: {len(steps)} шагов, протокол {digest[:16]}")
+        for action, samples in timings.items():
+            report(action, samples)
+
+    if len(digests) > 1:
+        print("❌ Протоколы прогонов различаются — игра недетерминирована")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
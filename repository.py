@@ -0,0 +1,103 @@
+import aiosqlite
+
+import dbtrace
+from models import (
+    Pair,
+    WaveState,
+    WaveAssignment,
+    Schedule,
+    Season,
+    pair_row,
+    wave_state_row,
+    wave_assignment_row,
+    schedule_row,
+    season_row,
+)
+
+# Чтение для хендлеров: модели с именованными полями вместо кортежей.
+# Запись и потоковое чтение ростера остаются в db.py.
+
+
+# ---------------- SANTA ----------------
+async def get_pair_by_santa(db_path: str, santa_id: int) -> Pair | None:
+    async with dbtrace.connect(db_path) as db:
+        db.row_factory = pair_row
+        cur = await db.execute(
+            "SELECT santa_id, child_id FROM pairs WHERE santa_id=?",
+            (santa_id,)
+        )
+        return await cur.fetchone()
+
+
+async def get_pair_by_child(db_path: str, child_id: int) -> Pair | None:
+    async with dbtrace.connect(db_path) as db:
+        db.row_factory = pair_row
+        cur = await db.execute(
+            "SELECT santa_id, child_id FROM pairs WHERE child_id=?",
+            (child_id,)
+        )
+        return await cur.fetchone()
+
+
+# ---------------- SCHEDULE ----------------
+async def list_schedules(db_path: str) -> list[Schedule]:
+    async with dbtrace.connect(db_path) as db:
+        db.row_factory = schedule_row
+        cur = await db.execute(
+            "SELECT hh, mm, recipients, percent, window_min FROM schedules ORDER BY hh, mm"
+        )
+        return await cur.fetchall()
+
+
+# ---------------- WAVES ----------------
+async def get_wave_state(db_path: str) -> WaveState:
+    async with dbtrace.connect(db_path) as db:
+        db.row_factory = wave_state_row
+        cur = await db.execute("""
+            SELECT wave_index, active_group_idx, is_initialized
+            FROM wave_state WHERE id=1
+        """)
+        row = await cur.fetchone()
+        return row if row else WaveState(0, 0, False)
+
+
+async def get_wave_groups(db_path: str) -> dict[int, list[int]]:
+    # номер группы → участники в порядке очереди
+    async with dbtrace.connect(db_path) as db:
+        cur = await db.execute("""
+            SELECT group_idx, tg_id
+            FROM wave_groups
+            ORDER BY group_idx, position
+        """)
+        rows = await cur.fetchall()
+
+    groups: dict[int, list[int]] = {}
+    for g_idx, tg_id in rows:
+        groups.setdefault(g_idx, []).append(tg_id)
+    return groups
+
+
+async def get_wave_assignments(db_path: str, wave_index: int) -> list[WaveAssignment]:
+    async with dbtrace.connect(db_path) as db:
+        db.row_factory = wave_assignment_row
+        cur = await db.execute(
+            """
+            SELECT wave_index, active_id, target_id, emotion
+            FROM wave_assignments
+            WHERE wave_index=?
+            """,
+            (wave_index,)
+        )
+        return await cur.fetchall()
+
+
+# ---------------- SEASONS ----------------
+async def list_seasons(registry_path: str) -> list[Season]:
+    async with aiosqlite.connect(registry_path) as db:
+        db.row_factory = season_row
+        cur = await db.execute("""
+        SELECT id, db_path, started_at, archived_at, is_active
+        FROM seasons
+        ORDER BY id
+        """)
+        return await cur.fetchall()
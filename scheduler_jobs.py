@@ -1,34 +1,181 @@
+import math
 import random
+import asyncio
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
 from aiogram import Bot
-from db import get_active_users, get_random_task, log_sent_task, get_user_label
+from db import get_random_task, log_sent_task, get_user_label, iter_active_users, count_active_users
+from delivery import send_or_mark, undeliverable_summary
+from profiling import profiled
+
+# сколько игроков пробуем, если выбранный заблокировал бота
+MAX_PICK_ATTEMPTS = 3
+
+
+async def sample_active_users(db_path: str, k: int, rng: random.Random | None = None):
+    # reservoir sampling: k случайных игроков за один проход по курсору
+    rng = rng or random
+    sample = []
+    seen = 0
+    async for batch in iter_active_users(db_path):
+        for user in batch:
+            seen += 1
+            if len(sample) < k:
+                sample.append(user)
+            else:
+                j = rng.randrange(seen)
+                if j < k:
+                    sample[j] = user
+    rng.shuffle(sample)
+    return sample
 
-async def job_send_random_task(bot: Bot, db_path: str, organizer_id: int):
-    users = await get_active_users(db_path)
-    if not users:
+
+@profiled("job_send_random_task")
+async def job_send_random_task(
+    bot: Bot,
+    db_path: str,
+    organizer_id: int,
+    rng: random.Random | None = None,
+    tz: str | None = None,
+    quiet_hours: tuple[int, int] | None = None,
+):
+    # тихие часы — только для расписания; разовый запуск разработчика их не ждёт
+    if tz and in_quiet_hours(datetime.now(ZoneInfo(tz)), quiet_hours):
+        return
+
+    candidates = await sample_active_users(db_path, MAX_PICK_ATTEMPTS, rng)
+    if not candidates:
         await bot.send_message(organizer_id, "⛔ Нет активных участников — задание не отправлено.")
         return
 
-    task = await get_random_task(db_path)
+    task = await get_random_task(db_path, rng)
     if not task:
         await bot.send_message(organizer_id, "⛔ Нет заданий в tasks. Заполни tasks.txt и перезапусти.")
         return
 
-    tg_id, username, full_name = random.choice(users)
-
     user_msg = (
         "🔔 *Тайная активность!*\n\n"
         f"{task}\n\n"
         "_Это видишь только ты_"
     )
-    org_msg = (
-        "📌 Назначена активность\n"
-        f"Кому: {full_name}" + (f" (@{username})" if username else "") + "\n"
-        f"Задание: {task}"
-    )
 
-    try:
-        await bot.send_message(tg_id, user_msg, parse_mode="Markdown")
+    blocked = []
+    for user in candidates:
+        try:
+            delivered = await send_or_mark(bot, db_path, user.tg_id, user_msg, parse_mode="Markdown")
+        except Exception as e:
+            await bot.send_message(organizer_id, f"⚠️ Не смог отправить задание пользователю {user.tg_id}. Ошибка: {e}")
+            return
+
+        if not delivered:
+            blocked.append(user.tg_id)
+            continue
+
+        org_msg = (
+            "📌 Назначена активность\n"
+            f"Кому: {user.label}\n"
+            f"Задание: {task}"
+        )
         await bot.send_message(organizer_id, org_msg)
-        await log_sent_task(db_path, tg_id, task)
-    except Exception as e:
-        await bot.send_message(organizer_id, f"⚠️ Не смог отправить задание пользователю {tg_id}. Ошибка: {e}")
+        await log_sent_task(db_path, user.tg_id, task)
+        break
+    else:
+        await bot.send_message(organizer_id, "⚠️ Задание никому не доставлено.")
+
+    if blocked:
+        await bot.send_message(organizer_id, await undeliverable_summary(db_path, blocked))
+
+
+# ---------------- ROUNDS ----------------
+def in_quiet_hours(now: datetime, quiet_hours: tuple[int, int] | None) -> bool:
+    """quiet_hours — (начало, конец) в минутах от полуночи, может переходить через 00:00."""
+    if not quiet_hours:
+        return False
+    start, end = quiet_hours
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def stagger_delays(n: int, window_sec: float, rng: random.Random | None = None) -> list[float]:
+    # равномерно по окну, внутри каждого слота — случайный сдвиг
+    if n <= 0:
+        return []
+    rng = rng or random
+    slot = window_sec / n
+    return [i * slot + rng.uniform(0, slot) for i in range(n)]
+
+
+@profiled("job_send_task_round")
+async def job_send_task_round(
+    bot: Bot,
+    db_path: str,
+    organizer_id: int,
+    recipients: int,
+    percent: int | None,
+    window_min: int,
+    tz: str,
+    quiet_hours: tuple[int, int] | None = None,
+    rng: random.Random | None = None,
+):
+    """
+    Раунд заданий: K игроков (или percent% ростера) получают по заданию,
+    доставки размазаны по окну window_min с джиттером —
+    ни всплеска в Telegram, ни пачки одновременных записей в базу.
+    """
+    if in_quiet_hours(datetime.now(ZoneInfo(tz)), quiet_hours):
+        return
+
+    if percent:
+        recipients = max(1, math.ceil(await count_active_users(db_path) * percent / 100))
+
+    candidates = await sample_active_users(db_path, recipients, rng)
+    if not candidates:
+        await bot.send_message(organizer_id, "⛔ Нет активных участников — раунд не проведён.")
+        return
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    delivered = []
+    blocked = []
+    failed = []
+    for user, delay in zip(candidates, stagger_delays(len(candidates), window_min * 60, rng)):
+        await asyncio.sleep(max(0.0, started + delay - loop.time()))
+
+        # окно зашло в тихие часы — остаток раунда не отправляем
+        if in_quiet_hours(datetime.now(ZoneInfo(tz)), quiet_hours):
+            break
+
+        task = await get_random_task(db_path, rng)
+        if not task:
+            await bot.send_message(organizer_id, "⛔ Нет заданий в tasks. Заполни tasks.txt и перезапусти.")
+            return
+
+        user_msg = (
+            "🔔 *Тайная активность!*\n\n"
+            f"{task}\n\n"
+            "_Это видишь только ты_"
+        )
+        try:
+            ok = await send_or_mark(bot, db_path, user.tg_id, user_msg, parse_mode="Markdown")
+        except Exception as e:
+            failed.append(f"• {user.label}: {e}")
+            continue
+
+        if not ok:
+            blocked.append(user.tg_id)
+            continue
+
+        await log_sent_task(db_path, user.tg_id, task)
+        delivered.append(user)
+
+    lines = [f"📌 Раунд заданий: доставлено {len(delivered)} из {len(candidates)}"]
+    lines += [f"• {u.label}" for u in delivered]
+    if failed:
+        lines += ["", "⚠️ Не смог отправить:"] + failed
+    await bot.send_message(organizer_id, "\n".join(lines))
+
+    if blocked:
+        await bot.send_message(organizer_id, await undeliverable_summary(db_path, blocked))
@@ -0,0 +1,92 @@
+import os
+import aiosqlite
+from datetime import datetime
+
+from db import init_db, load_tasks_if_empty
+
+
+# ---------------- REGISTRY ----------------
+# Каждый сезон игры живёт в отдельном файле SQLite.
+# Реестр сезонов хранит, какой файл сейчас активный, а какие — архив.
+async def init_seasons(registry_path: str, legacy_db_path: str) -> str:
+    async with aiosqlite.connect(registry_path) as db:
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS seasons(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            db_path TEXT NOT NULL UNIQUE,
+            started_at TEXT NOT NULL,
+            archived_at TEXT,
+            is_active INTEGER NOT NULL DEFAULT 0
+        )""")
+
+        # активный сезон может быть только один
+        await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS seasons_one_active
+        ON seasons(is_active) WHERE is_active=1
+        """)
+
+        cur = await db.execute("SELECT db_path FROM seasons WHERE is_active=1")
+        row = await cur.fetchone()
+        if row:
+            await db.commit()
+            return row[0]
+
+        # первый запуск: текущая база становится первым сезоном
+        await db.execute(
+            "INSERT INTO seasons(db_path, started_at, is_active) VALUES(?, ?, 1)",
+            (legacy_db_path, datetime.utcnow().isoformat())
+        )
+        await db.commit()
+        return legacy_db_path
+
+
+async def get_active_season_path(registry_path: str) -> str | None:
+    async with aiosqlite.connect(registry_path) as db:
+        cur = await db.execute("SELECT db_path FROM seasons WHERE is_active=1")
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+async def start_new_season(registry_path: str, seasons_dir: str, tasks_file: str) -> str:
+    """
+    Сброс игры за O(1): создаём файл нового сезона со схемой и заданиями,
+    затем одной транзакцией в реестре архивируем старый и активируем новый.
+    Данные прошлого сезона остаются нетронутыми в его файле.
+    """
+    os.makedirs(seasons_dir, exist_ok=True)
+    now = datetime.utcnow()
+    new_path = os.path.join(seasons_dir, f"season_{now.strftime('%Y%m%d_%H%M%S_%f')}.db")
+
+    await init_db(new_path)
+    # задания сбросом не затирались и раньше — новый сезон стартует с ними
+    await load_tasks_if_empty(new_path, tasks_file)
+
+    async with aiosqlite.connect(registry_path) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        await db.execute(
+            "UPDATE seasons SET is_active=0, archived_at=? WHERE is_active=1",
+            (now.isoformat(),)
+        )
+        await db.execute(
+            "INSERT INTO seasons(db_path, started_at, is_active) VALUES(?, ?, 1)",
+            (new_path, now.isoformat())
+        )
+        await db.commit()
+
+    return new_path
+
+
+# ---------------- ARCHIVE ----------------
+
+
+async def get_season_stats(season_db_path: str) -> dict[str, int]:
+    if not os.path.exists(season_db_path):
+        return {}
+
+    uri = f"file:{season_db_path}?mode=ro"
+    stats: dict[str, int] = {}
+    async with aiosqlite.connect(uri, uri=True) as db:
+        for table in ("users", "pairs", "sent_tasks", "wave_assignments"):
+            cur = await db.execute(f"SELECT COUNT(*) FROM {table}")
+            (stats[table],) = await cur.fetchone()
+    return stats
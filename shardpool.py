@@ -0,0 +1,70 @@
+import time
+import asyncio
+
+import aiosqlite
+
+# сколько простаивающих соединений держим на один файл базы
+MAX_IDLE_PER_PATH = 4
+
+
+class ShardPool:
+    """
+    Пул соединений aiosqlite по файлам баз (шардам).
+    Соединение открывается при первом обращении к шарду,
+    возвращается в пул после запроса и закрывается, если простаивало дольше max_idle.
+    """
+
+    def __init__(self):
+        self._idle: dict[str, list[tuple[aiosqlite.Connection, float]]] = {}
+
+    async def acquire(self, db_path: str) -> aiosqlite.Connection:
+        idle = self._idle.get(db_path)
+        if idle:
+            conn, _ = idle.pop()
+            return conn
+        return await aiosqlite.connect(db_path)
+
+    async def release(self, db_path: str, conn: aiosqlite.Connection, broken: bool = False):
+        if conn.in_transaction:
+            await conn.rollback()
+        conn.row_factory = None
+
+        idle = self._idle.setdefault(db_path, [])
+        if broken or len(idle) >= MAX_IDLE_PER_PATH:
+            await conn.close()
+            return
+        idle.append((conn, time.monotonic()))
+
+    async def evict_idle(self, max_idle: float) -> int:
+        deadline = time.monotonic() - max_idle
+        closed = 0
+        for path in list(self._idle):
+            keep = []
+            for conn, last_used in self._idle[path]:
+                if last_used < deadline:
+                    await conn.close()
+                    closed += 1
+                else:
+                    keep.append((conn, last_used))
+            if keep:
+                self._idle[path] = keep
+            else:
+                del self._idle[path]
+        return closed
+
+    async def close_all(self):
+        # потоки aiosqlite не демоны: без закрытия процесс не завершится
+        for path in list(self._idle):
+            for conn, _ in self._idle.pop(path):
+                await conn.close()
+
+    async def run_evictor(self, max_idle: float, every: float = 60):
+        while True:
+            await asyncio.sleep(every)
+            await self.evict_idle(max_idle)
+
+    def stats(self) -> dict[str, int]:
+        return {path: len(conns) for path, conns in self._idle.items()}
+
+
+pool = ShardPool()
@@ -0,0 +1,55 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """
+    Не больше одного запуска операции одновременно.
+
+    Повторный вызов той же операции, пока она идёт, получает уже запущенную
+    задачу с пометкой «дубль». Повторная доставка с тем же ключом
+    идемпотентности (id колбэка) получает задачу первого запуска,
+    даже если она уже завершилась — пока ключ не устарел.
+    """
+
+    def __init__(self, remember_sec: float = 600):
+        self.remember_sec = remember_sec
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._keys: dict[str, tuple[asyncio.Task, float]] = {}
+
+    def _forget_expired(self, now: float):
+        for k in [k for k, (_, exp) in self._keys.items() if exp < now]:
+            del self._keys[k]
+
+    def start(
+        self,
+        op: str,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> tuple[asyncio.Task, bool]:
+        """
+        Возвращает (задача, был_ли_это_дубль) сразу, не дожидаясь результата:
+        на дубль можно ответить, пока первая рассылка ещё идёт.
+        Ждать задачу — через asyncio.shield, чтобы отмена ждущего её не обрывала.
+        """
+        now = time.monotonic()
+        self._forget_expired(now)
+
+        idem_key = f"{op}:{key}"
+        if idem_key in self._keys:
+            return self._keys[idem_key][0], True
+
+        task = self._inflight.get(op)
+        duplicate = task is not None
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[op] = task
+            task.add_done_callback(lambda t: self._release(op, t))
+
+        self._keys[idem_key] = (task, now + self.remember_sec)
+        return task, duplicate
+
+    def _release(self, op: str, task: asyncio.Task):
+        if self._inflight.get(op) is task:
+            del self._inflight[op]
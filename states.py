@@ -0,0 +1,10 @@
+from aiogram.fsm.state import State, StatesGroup
+
+
+class GroupSay(StatesGroup):
+    waiting_text = State()
+
+
+class Relay(StatesGroup):
+    to_child = State()
+    to_santa = State()
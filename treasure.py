@@ -0,0 +1,175 @@
+import re
+from functools import lru_cache
+
+
+# ---------------- FILE FORMAT ----------------
+# Строка treasure.txt: «загадка | ответ1; ответ2; ...»
+def parse_treasure_line(line: str) -> tuple[str, list[str]]:
+    riddle, _, answers = line.partition("|")
+    return riddle.strip(), [a.strip() for a in answers.split(";") if a.strip()]
+
+
+# ---------------- NORMALIZATION ----------------
+_WORD_RE = re.compile(r"[а-яa-z0-9]+")
+
+# окончания падежей и родов, длинные первыми; «й» — для основ вроде «музей»
+_ENDINGS = (
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ием", "иям", "иях",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ую", "юю", "ою", "ею",
+    "ам", "ям", "ах", "ях", "ом", "ем", "ов", "ев", "ью", "ия", "ие", "ию", "ии",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+@lru_cache(maxsize=65536)
+def stems(word: str) -> tuple[str, ...]:
+    """
+    Все основы слова: само слово и оно без каждого подходящего окончания.
+    Часть речи не знаем, поэтому одно жадное отсечение не годится:
+    «статуя» → «стату», но «статую» → «стат»; «музей» → «муз», но «музея» → «музе».
+    Формы одного слова совпадают хотя бы по одной основе.
+    """
+    out = [word]
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            out.append(word[:-len(ending)])
+    return tuple(dict.fromkeys(out))
+
+
+def root(word: str) -> str:
+    # самая короткая основа — по ней считаем опечатки
+    return min(stems(word), key=len)
+
+
+def within_distance(a: str, b: str, k: int) -> bool:
+    """Расстояние Левенштейна ≤ k, считаем только полосу шириной 2k+1."""
+    if abs(len(a) - len(b)) > k:
+        return False
+    if a == b:
+        return True
+
+    inf = k + 1
+    prev = [j if j <= k else inf for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [inf] * (len(b) + 1)
+        if i <= k:
+            cur[0] = i
+        lo, hi = max(1, i - k), min(len(b), i + k)
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+        if min(cur[lo - 1:hi + 1]) > k:
+            return False
+        prev = cur
+    return prev[len(b)] <= k
+
+
+def _max_typos(a: str, b: str) -> int:
+    # бюджет по более короткой основе: иначе длинное слово из чата
+    # «дотягивается» до короткого ответа («трик» → «рик», «статус» → «статуя»)
+    n = min(len(a), len(b))
+    if n >= 8:
+        return 2
+    if n >= 6:
+        return 1
+    return 0
+
+
+# ---------------- MATCHER ----------------
+_FUZZY_CACHE_SIZE = 65536
+
+
+class AnswerMatcher:
+    """
+    Индекс ответов активной загадки: все основы слов ответов заранее
+    разложены по словарю, так что на каждое сообщение из чата —
+    только токенизация и поиск по dict. Опечатки ловим ограниченным
+    расстоянием Левенштейна между кратчайшими основами.
+    """
+
+    def __init__(self, riddle: str, answers: list[str]):
+        self.riddle = riddle
+        self.answers = answers
+        self._words = [tuple(tokenize(a)) for a in answers]
+        # основа → слова ответов, у которых она есть
+        self._vocab: dict[str, set[str]] = {}
+        self._roots: dict[str, set[str]] = {}
+        for words in self._words:
+            for w in words:
+                for s in stems(w):
+                    self._vocab.setdefault(s, set()).add(w)
+                self._roots.setdefault(root(w), set()).add(w)
+        # слово из чата → слова ответов, с которыми оно совпало
+        self._fuzzy: dict[str, frozenset[str]] = {}
+
+    def _lookup(self, word: str) -> frozenset[str]:
+        if word in self._fuzzy:
+            return self._fuzzy[word]
+
+        hits = set()
+        for s in stems(word):
+            hits |= self._vocab.get(s, set())
+
+        if not hits:
+            r = root(word)
+            for v, words in self._roots.items():
+                k = _max_typos(r, v)
+                if k and within_distance(r, v, k):
+                    hits |= words
+
+        if len(self._fuzzy) >= _FUZZY_CACHE_SIZE:
+            self._fuzzy.clear()
+        self._fuzzy[word] = frozenset(hits)
+        return self._fuzzy[word]
+
+    def match(self, text: str) -> str | None:
+        found = set()
+        for word in tokenize(text):
+            found |= self._lookup(word)
+
+        if not found:
+            return None
+
+        for answer, words in zip(self.answers, self._words):
+            if words and all(w in found for w in words):
+                return answer
+        return None
+
+
+# ---------------- CHECK ----------------
+# Падежные формы ответов: `python treasure.py` проверяет, что все узнаются,
+# а похожие чужие слова — нет.
+_CASE_FORMS = {
+    "статуя": ["статуя", "нашёл статую", "у статуи", "к статуе", "под статуей", "статуй", "статуям"],
+    "музей": ["музей", "у музея", "к музею", "за музеем", "в музее", "музеи", "музеев"],
+    "картина": ["картина", "картины", "картине", "картину", "картиной"],
+    "портрет": ["портрет", "портрета", "портрету", "портретом", "портрете"],
+    "скульптура": ["скульптура", "скульптуры", "скульптуру", "скульптурой", "скульптруа"],
+    "истукан": ["истукан", "истукана", "истукану", "истуканом"],
+    "фотозона": ["фотозона", "фотозоны", "фотозоне", "фотозону", "фотозоной"],
+    "рик": ["рик", "рика", "рику", "риком", "рике"],
+    "медуза горгона": ["медуза горгона", "медузу горгону", "медузой горгоной", "медузы горгоны"],
+}
+_NOT_ANSWERS = {
+    "статуя": ["статус", "статья"],
+    "рик": ["трик", "крик"],
+    "картина": ["карта"],
+}
+
+
+if __name__ == "__main__":
+    import sys
+
+    failed = []
+    for answer, forms in _CASE_FORMS.items():
+        m = AnswerMatcher("", [answer])
+        failed += [f"{answer}: не узнал «{f}»" for f in forms if m.match(f) != answer]
+    for answer, words in _NOT_ANSWERS.items():
+        m = AnswerMatcher("", [answer])
+        failed += [f"{answer}: принял «{w}»" for w in words if m.match(w)]
+    print("\n".join(failed) or "ok")
+    sys.exit(1 if failed else 0)